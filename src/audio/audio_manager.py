@@ -1,36 +1,78 @@
-import io
-from pytubefix import YouTube
+import os
+from pytubefix import Channel, Playlist, YouTube
+from pytubefix.exceptions import BotDetection, LoginRequired, VideoUnavailable
 import ffmpeg
-from pydub import AudioSegment
 
-def download_audio_as_bytes(youtube_url, client='WEB_CREATOR'):
+from audio.downloader import download_resumable
+
+def is_video_error(error):
+    """Whether a download failed because of the video itself (private, removed, age restricted...), not the client."""
+    # Bot checks and login walls depend on the client that met them
+    return isinstance(error, VideoUnavailable) and not isinstance(error, (BotDetection, LoginRequired))
+
+def download_audio_to_file(youtube_url, file_path, client='WEB_CREATOR', connections=1, parallel_min_size=64 * 1024 * 1024):
+    """Download the audio stream and transcode it to mp3.
+
+    The raw stream is fetched with range requests into source.partial next to file_path and survives a
+    failed attempt, so the next attempt (even with another client) resumes where this one stopped.
+    With a single connection chunks are piped into ffmpeg as they arrive; streams of at least
+    parallel_min_size are fetched over several connections and transcoded once complete.
+    """
     yt = YouTube(youtube_url, client=client)
     audio_stream = yt.streams.filter(only_audio=True).first()
 
-    audio_buffer = io.BytesIO()
-    audio_stream.stream_to_buffer(audio_buffer)
-    audio_buffer.seek(0)
+    source_path = os.path.join(os.path.dirname(file_path), "source.partial")
+    source_id = f"{audio_stream.itag}:{audio_stream.filesize}"
+    # Write under a temporary name so an interrupted transcode never looks finished
+    partial_path = f"{file_path}.partial"
+
+    if connections > 1 and audio_stream.filesize >= parallel_min_size:
+        downloaded_bytes = download_resumable(audio_stream.url, source_path, audio_stream.filesize, source_id,
+                                              connections=connections)
+        process = (
+            ffmpeg
+            .input(source_path)
+            .output(partial_path, format='mp3')
+            .global_args('-loglevel', 'error')
+            .overwrite_output()
+            .run_async(pipe_stderr=True)
+        )
+    else:
+        process = (
+            ffmpeg
+            .input('pipe:0')
+            .output(partial_path, format='mp3')
+            .global_args('-loglevel', 'error')
+            .overwrite_output()
+            .run_async(pipe_stdin=True, pipe_stderr=True)
+        )
+        try:
+            downloaded_bytes = download_resumable(audio_stream.url, source_path, audio_stream.filesize, source_id,
+                                                  on_chunk=process.stdin.write)
+        except Exception:
+            # Closing stdin would make ffmpeg finish a truncated file
+            process.kill()
+            process.wait()
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+            raise
 
-    process = (
-        ffmpeg
-        .input('pipe:0')
-        .output('pipe:1', format='mp3')
-        .run_async(pipe_stdin=True, pipe_stdout=True, pipe_stderr=True)
-    )
+    _, err = process.communicate()
+    if process.returncode != 0:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        raise RuntimeError(f"Failed to transcode audio from {youtube_url}: {err.decode(errors='replace')}")
 
-    stdout, _ = process.communicate(input=audio_buffer.read())
+    os.replace(partial_path, file_path)
+    os.remove(source_path)
+    return downloaded_bytes, yt.title, yt.author
 
-    return stdout, yt.title, yt.author
+def expand_collection_url(collection_url):
+    """Return the video URLs of a playlist or channel URL."""
+    if '/playlist' in collection_url:
+        return list(Playlist(collection_url).video_urls)
+    return list(Channel(collection_url).video_urls)
 
 def get_title_author(youtube_url):
     yt = YouTube(youtube_url)
     return yt.title, yt.author
-
-def split_audio(audio_data, chunk_duration_ms):
-    audio = AudioSegment.from_file(io.BytesIO(audio_data), format="mp3")
-    chunks = []
-
-    for i in range(0, len(audio), chunk_duration_ms):
-        chunks.append(audio[i:i + chunk_duration_ms])
-
-    return chunks
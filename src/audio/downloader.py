@@ -0,0 +1,120 @@
+import json
+import os
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from http.client import HTTPException
+
+# Streams are fetched in segments no larger than this, each with its own Range request
+SEGMENT_SIZE = 9 * 1024 * 1024
+READ_SIZE = 256 * 1024
+USER_AGENT = "Mozilla/5.0"
+
+def _load_state(partial_path, state_path, source_id, total_size):
+    """Return the saved segment progress if it belongs to the same stream, otherwise a fresh plan."""
+    if os.path.exists(partial_path) and os.path.exists(state_path):
+        with open(state_path, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+        if state.get('source') == source_id and state.get('size') == total_size:
+            return state
+    segments = [[start, start, min(start + SEGMENT_SIZE, total_size)] for start in range(0, total_size, SEGMENT_SIZE)]
+    return {'source': source_id, 'size': total_size, 'segments': segments}
+
+def _save_state(state_path, state):
+    temp_path = f"{state_path}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f)
+    os.replace(temp_path, state_path)
+
+def _fetch_segment(url, segment, partial_path, save_progress, on_chunk, max_retries, timeout):
+    """Download the missing part of one [start, done, end] segment, resuming after dropped connections."""
+    failures = 0
+    with open(partial_path, 'r+b') as f:
+        while segment[1] < segment[2]:
+            headers = {"User-Agent": USER_AGENT, "Range": f"bytes={segment[1]}-{segment[2] - 1}"}
+            try:
+                with urllib.request.urlopen(urllib.request.Request(url, headers=headers), timeout=timeout) as response:
+                    if response.status != 206:
+                        raise RuntimeError(f"Server ignored the range request (HTTP {response.status})")
+                    f.seek(segment[1])
+                    while segment[1] < segment[2]:
+                        chunk = response.read(min(READ_SIZE, segment[2] - segment[1]))
+                        if not chunk:
+                            raise ConnectionError("Connection closed before the end of the range")
+                        f.write(chunk)
+                        # Data must be on disk before the progress file says so
+                        f.flush()
+                        segment[1] += len(chunk)
+                        failures = 0
+                        save_progress(len(chunk))
+                        if on_chunk is not None:
+                            try:
+                                on_chunk(chunk)
+                            except OSError as e:
+                                # A failing consumer (e.g. a closed pipe) must not look like a network error
+                                raise RuntimeError(f"Failed to pass downloaded data on: {e}") from e
+            except urllib.error.HTTPError as e:
+                # Client errors (expired URL, forbidden) will not go away by retrying
+                if e.code < 500 and e.code not in (408, 429):
+                    raise
+                failures += 1
+                if failures > max_retries:
+                    raise
+                time.sleep(min(2 ** failures, 30))
+            except (OSError, HTTPException):
+                failures += 1
+                if failures > max_retries:
+                    raise
+                time.sleep(min(2 ** failures, 30))
+
+def _replay(partial_path, start, end, on_chunk):
+    """Feed bytes that are already on disk to on_chunk, so a resumed download still delivers the whole stream."""
+    with open(partial_path, 'rb') as f:
+        f.seek(start)
+        while start < end:
+            chunk = f.read(min(READ_SIZE, end - start))
+            if not chunk:
+                break
+            start += len(chunk)
+            on_chunk(chunk)
+
+def download_resumable(url, partial_path, total_size, source_id, connections=1, on_chunk=None, max_retries=5, timeout=30):
+    """
+    Download url into partial_path with HTTP range requests, resuming whatever an earlier attempt left.
+
+    Progress is kept next to the file in <partial_path>.json and only reused for the same source_id and size.
+    With one connection on_chunk receives the whole stream in order, including bytes that were already on
+    disk. With more connections the missing segments are fetched in parallel and on_chunk is not called.
+    Returns the number of bytes fetched over the network.
+    """
+    state_path = f"{partial_path}.json"
+    state = _load_state(partial_path, state_path, source_id, total_size)
+    with open(partial_path, 'r+b' if os.path.exists(partial_path) else 'wb') as f:
+        f.truncate(total_size)
+
+    fetched = [0]
+    lock = threading.Lock()
+
+    def save_progress(chunk_size):
+        with lock:
+            fetched[0] += chunk_size
+            _save_state(state_path, state)
+
+    if connections <= 1:
+        for segment in state['segments']:
+            if on_chunk is not None:
+                _replay(partial_path, segment[0], segment[1], on_chunk)
+            _fetch_segment(url, segment, partial_path, save_progress, on_chunk, max_retries, timeout)
+    else:
+        missing = [segment for segment in state['segments'] if segment[1] < segment[2]]
+        with ThreadPoolExecutor(max_workers=connections) as executor:
+            futures = [executor.submit(_fetch_segment, url, segment, partial_path, save_progress, None, max_retries, timeout)
+                       for segment in missing]
+            for future in futures:
+                future.result()
+
+    if os.path.exists(state_path):
+        os.remove(state_path)
+    return fetched[0]
@@ -1,5 +1,3 @@
-import numpy as np
-
 def is_valid_frame(frame, frame_rate, frame_duration_ms):
     """
     Check if the frame is valid for webrtcvad.
@@ -24,16 +22,3 @@ def is_valid_frame(frame, frame_rate, frame_duration_ms):
         return False
 
     return True
-
-
-def stereo_to_mono(stereo_frame):
-    # Assuming stereo_frame is a NumPy array with shape (2, N) where N is the number of samples
-    mono_frame = np.mean(stereo_frame, axis=0)
-    return mono_frame.astype(stereo_frame.dtype)
-
-
-def to_mono(data):
-    stereo_frame = np.frombuffer(data, dtype=np.int16)
-    stereo_frame = stereo_frame.reshape(-1, 2).T
-    mono_frame = stereo_to_mono(stereo_frame).tobytes()
-    return mono_frame
\ No newline at end of file
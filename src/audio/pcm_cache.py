@@ -0,0 +1,94 @@
+import os
+import subprocess
+import threading
+import numpy as np
+
+SAMPLE_RATE = 16000
+PCM_FILE_NAME = "audio_16k.pcm"
+
+def decode_to_pcm(source_path, pcm_path, sample_rate=SAMPLE_RATE):
+    """
+    Decode an audio file to raw mono 16-bit PCM at the given sample rate with a single FFmpeg run.
+
+    Parameters:
+    - source_path: Any audio file FFmpeg can read; its own sample rate and channel count are detected.
+    - pcm_path: Where to write the raw samples.
+    - sample_rate: Output sample rate.
+    """
+    partial_path = f"{pcm_path}.partial"
+    command = [
+        'ffmpeg',
+        '-hide_banner',
+        '-loglevel', 'error',
+        '-y',
+        '-i', source_path,
+        '-f', 's16le',  # Output format
+        '-acodec', 'pcm_s16le',  # Output codec
+        '-ar', str(sample_rate),  # Output sample rate
+        '-ac', '1',  # Number of audio channels in output
+        partial_path
+    ]
+    process = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    if process.returncode != 0:
+        raise RuntimeError(f"FFmpeg returned error: {process.stderr.decode()}")
+    os.replace(partial_path, pcm_path)
+
+def load_pcm(source_path, pcm_path):
+    """Return the cached PCM samples of source_path as a read-only int16 memmap, decoding them on first use."""
+    if not os.path.exists(pcm_path):
+        decode_to_pcm(source_path, pcm_path)
+    if os.path.getsize(pcm_path) == 0:
+        return np.zeros(0, dtype=np.int16)
+    return np.memmap(pcm_path, dtype=np.int16, mode='r')
+
+def pcm_to_float32(samples):
+    """Convert int16 samples to the float32 [-1, 1] range Whisper expects."""
+    return samples.astype(np.float32) / np.iinfo(np.int16).max
+
+def encode_opus(blocks, bitrate_kbps, sample_rate=SAMPLE_RATE):
+    """
+    Encode int16 mono samples to Ogg Opus tuned for speech, returning the file contents.
+
+    blocks is a sequence of sample arrays (e.g. memmap slices) that are written to FFmpeg one after
+    another, so the samples are never joined into one copy in memory.
+    """
+    command = [
+        'ffmpeg',
+        '-hide_banner',
+        '-loglevel', 'error',
+        '-f', 's16le',  # Input format
+        '-ar', str(sample_rate),
+        '-ac', '1',
+        '-i', 'pipe:0',
+        '-c:a', 'libopus',
+        '-b:a', f'{bitrate_kbps}k',
+        '-vbr', 'constrained',  # Keeps the size close to bitrate * duration
+        '-application', 'voip',
+        '-f', 'ogg',
+        'pipe:1'
+    ]
+    process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    def feed():
+        try:
+            for block in blocks:
+                process.stdin.write(memoryview(np.ascontiguousarray(block, dtype=np.int16)).cast('B'))
+        except BrokenPipeError:
+            # FFmpeg exited early; its error is reported below
+            pass
+        finally:
+            try:
+                process.stdin.close()
+            except BrokenPipeError:
+                pass
+
+    # Written from another thread while this one drains stdout, so neither pipe fills up and blocks
+    writer = threading.Thread(target=feed)
+    writer.start()
+    output = process.stdout.read()
+    stderr = process.stderr.read()
+    writer.join()
+    process.wait()
+    if process.returncode != 0:
+        raise RuntimeError(f"FFmpeg returned error: {stderr.decode()}")
+    return output
@@ -0,0 +1,105 @@
+import math
+import numpy as np
+
+class StreamingResampler:
+    """
+    Polyphase FIR resampler for a continuous stream of interleaved int16 frames.
+
+    Filter state is carried across calls, so consecutive 10 ms frames resample exactly as if the
+    whole stream had been converted at once, without spawning FFmpeg per chunk.
+    """
+
+    def __init__(self, in_rate, out_rate=16000, channels=1, taps_per_phase=16):
+        divisor = math.gcd(in_rate, out_rate)
+        self.up = out_rate // divisor
+        self.down = in_rate // divisor
+        self.channels = channels
+        self.taps = taps_per_phase
+
+        # Windowed-sinc low-pass prototype at the upsampled rate, cut off below the lower Nyquist frequency
+        length = taps_per_phase * self.up
+        cutoff = 0.45 / max(self.up, self.down)
+        n = np.arange(length) - (length - 1) / 2
+        prototype = 2 * cutoff * np.sinc(2 * cutoff * n) * np.kaiser(length, 8.0) * self.up
+        # phases[p][k] weights input sample (base - k) for outputs falling on upsampled phase p
+        self.phases = prototype.reshape(self.taps, self.up).T.astype(np.float32)
+        self.tap_offsets = np.arange(self.taps)
+        self.next_position = 0  # upsampled position of the next output, relative to the next input block
+        # The last taps - 1 input samples followed by the current block; the other buffers hold the
+        # per-output indices and products. They are reused between calls, reallocated only when the block size changes.
+        self.extended = np.zeros(self.taps - 1, dtype=np.float32)
+        self._allocate(0)
+
+    def _allocate(self, frame_count):
+        max_outputs = -(-frame_count * self.up // self.down) + 1
+        self.extended = np.concatenate((self.extended[:self.taps - 1], np.zeros(frame_count, dtype=np.float32)))
+        self.steps = np.arange(max_outputs) * self.down
+        self.positions = np.zeros(max_outputs, dtype=np.int64)
+        self.phase_index = np.zeros(max_outputs, dtype=np.int64)
+        self.indices = np.zeros((max_outputs, self.taps), dtype=np.int64)
+        self.weights = np.zeros((max_outputs, self.taps), dtype=np.float32)
+        self.window = np.zeros((max_outputs, self.taps), dtype=np.float32)
+        self.output = np.zeros(max_outputs, dtype=np.float32)
+
+    def process(self, data):
+        """
+        Resample a block of interleaved int16 bytes, returning mono float32 samples in [-1, 1].
+
+        The result is a view into a buffer reused by the next call.
+        """
+        frames = np.frombuffer(data, dtype=np.int16).reshape(-1, self.channels)
+        frame_count = len(frames)
+        if len(self.extended) != self.taps - 1 + frame_count:
+            self._allocate(frame_count)
+        block = self.extended[self.taps - 1:]
+        np.mean(frames, axis=1, dtype=np.float32, out=block)
+        block /= np.iinfo(np.int16).max
+
+        upsampled_end = frame_count * self.up
+        count = max(0, -(-(upsampled_end - self.next_position) // self.down))
+        positions = self.positions[:count]
+        np.add(self.steps[:count], self.next_position, out=positions)
+        phase_index = self.phase_index[:count]
+        np.remainder(positions, self.up, out=phase_index)
+        indices = self.indices[:count]
+        # indices[i][k] = positions[i] // up + taps - 1 - k, the input sample weighted by tap k
+        np.floor_divide(positions[:, None], self.up, out=indices)
+        indices += self.taps - 1
+        indices -= self.tap_offsets
+        np.take(self.phases, phase_index, axis=0, out=self.weights[:count])
+        np.take(self.extended, indices, out=self.window[:count])
+        output = self.output[:count]
+        np.einsum('ij,ij->i', self.window[:count], self.weights[:count], out=output)
+
+        last_position = positions[-1] if count else self.next_position - self.down
+        self.next_position = last_position + self.down - upsampled_end
+        self.extended[:self.taps - 1] = self.extended[frame_count:]
+        return output
+
+class AudioRingBuffer:
+    """Preallocated float32 ring buffer addressed by absolute sample positions."""
+
+    def __init__(self, capacity):
+        self.buffer = np.zeros(capacity, dtype=np.float32)
+        self.capacity = capacity
+        self.written = 0  # total samples ever written
+
+    def write(self, samples):
+        samples = samples[-self.capacity:]
+        start = self.written % self.capacity
+        first = min(len(samples), self.capacity - start)
+        self.buffer[start:start + first] = samples[:first]
+        self.buffer[:len(samples) - first] = samples[first:]
+        self.written += len(samples)
+
+    def is_available(self, start):
+        """False once the samples from start on have been overwritten."""
+        return self.written - start <= self.capacity
+
+    def get(self, start, end):
+        """Samples [start, end) as a view into the buffer, copied only when the range wraps around."""
+        first = start % self.capacity
+        last = first + (end - start)
+        if last <= self.capacity:
+            return self.buffer[first:last]
+        return np.concatenate((self.buffer[first:], self.buffer[:last - self.capacity]))
@@ -1,17 +1,70 @@
-import whisper
 import logging
 import time
 
-def transcribe_audio(logger: logging, model: whisper, audio):
+# Transcription engines selectable with [WHISPER] backend. Every backend returns segments as
+# dicts with start and end in seconds and text, so callers do not depend on the engine.
+
+class OpenAIWhisperBackend:
+    """The reference openai-whisper implementation on PyTorch."""
+
+    def __init__(self, model_name, device_name, compute_type=None, threads=None):
+        import whisper
+        if threads:
+            import torch
+            torch.set_num_threads(threads)
+            try:
+                torch.set_num_interop_threads(1)
+            except RuntimeError:
+                # Can only be set once per process, e.g. not in a fork of a process that already used torch
+                pass
+        if device_name == 'gpu':
+            self.model = whisper.load_model(model_name)
+        else:
+            self.model = whisper.load_model(model_name, device=device_name)
+
+    def transcribe(self, audio):
+        result = self.model.transcribe(audio, fp16=False)
+        return [{'start': item['start'], 'end': item['end'], 'text': item['text']} for item in result["segments"]]
+
+class FasterWhisperBackend:
+    """CTranslate2-based faster-whisper, which runs int8-quantized models on CPU."""
+
+    def __init__(self, model_name, device_name, compute_type='int8', threads=None):
+        # Optional dependency, only needed when this backend is configured
+        from faster_whisper import WhisperModel
+        device = 'cuda' if device_name == 'gpu' else device_name
+        self.model = WhisperModel(model_name, device=device, compute_type=compute_type, cpu_threads=threads or 0)
+
+    def transcribe(self, audio):
+        segments, _ = self.model.transcribe(audio)
+        # Segments are generated lazily, decoding happens while iterating
+        return [{'start': segment.start, 'end': segment.end, 'text': segment.text} for segment in segments]
+
+BACKENDS = {
+    'openai-whisper': OpenAIWhisperBackend,
+    'faster-whisper': FasterWhisperBackend
+}
+DEFAULT_BACKEND = 'openai-whisper'
+
+def load_whisper_model(model_name, device_name, backend=DEFAULT_BACKEND, compute_type='int8', threads=None):
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown transcription backend '{backend}', expected one of: {', '.join(BACKENDS)}")
+    return BACKENDS[backend](model_name, device_name, compute_type=compute_type, threads=threads)
+
+def transcribe_segments(logger: logging, model, audio):
+    """Transcribe audio, returning segments as dicts with start and end in seconds and text."""
     start_time = time.time()  # Start timing
 
-    result = model.transcribe(audio, fp16=False)
+    segments = model.transcribe(audio)
 
     end_time = time.time()  # End timing
     execution_time = (end_time - start_time) * 1000  # Convert to milliseconds
 
     logger.debug(f"Transcribe time: {execution_time} milliseconds")
 
-    segments = result["segments"]
+    return segments
+
+def transcribe_audio(logger: logging, model, audio):
+    segments = transcribe_segments(logger, model, audio)
     texts = [item['text'] for item in segments]
-    return texts
\ No newline at end of file
+    return texts
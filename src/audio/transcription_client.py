@@ -0,0 +1,43 @@
+import json
+import os
+import urllib.error
+import urllib.parse
+import urllib.request
+import numpy as np
+
+class TranscriptionClient:
+    """Client of main_transcription_server.py, which keeps Whisper models loaded between jobs."""
+
+    def __init__(self, server_url, model_name, timeout=3600):
+        self.server_url = server_url.rstrip('/')
+        self.model_name = model_name
+        self.timeout = timeout
+
+    def _request(self, path, data=None, content_type=None, timeout=None):
+        headers = {"Content-Type": content_type} if content_type else {}
+        request = urllib.request.Request(f"{self.server_url}{path}", data=data, headers=headers)
+        with urllib.request.urlopen(request, timeout=timeout or self.timeout) as response:
+            return json.loads(response.read())
+
+    def is_available(self):
+        """True if the server is running and has this client's model loaded."""
+        try:
+            health = self._request("/health", timeout=2)
+        except (OSError, ValueError):
+            return False
+        return self.model_name in health.get('models', [])
+
+    def transcribe_pcm(self, samples):
+        """Transcribe float32 16 kHz mono samples sent in the request body."""
+        query = urllib.parse.urlencode({'model': self.model_name})
+        body = np.ascontiguousarray(samples, dtype='<f4').tobytes()
+        return self._request(f"/transcribe?{query}", body, "application/octet-stream")['segments']
+
+    def transcribe_file(self, pcm_path, spans):
+        """Transcribe (start, end) sample spans of a PCM cache file the server reads itself, times mapped to the file."""
+        body = json.dumps({
+            'model': self.model_name,
+            'path': os.path.abspath(pcm_path),
+            'spans': [list(span) for span in spans]
+        }).encode('utf-8')
+        return self._request("/transcribe", body, "application/json")['segments']
@@ -0,0 +1,101 @@
+import numpy as np
+import webrtcvad
+
+from audio.pcm_cache import SAMPLE_RATE
+
+# webrtcvad accepts 10, 20 or 30 ms frames; the longest one means the fewest calls per file
+FRAME_MS = 30
+# Frames quieter than this RMS (int16 units, about -50 dBFS) are silence without asking the VAD
+SILENCE_RMS = 100
+# Frames classified per block, so the whole memmap is never loaded at once
+BLOCK_FRAMES = 20000
+
+def detect_speech(pcm, vad_mode, frame_ms=FRAME_MS):
+    """
+    Classify every frame of 16 kHz int16 PCM as speech or not.
+
+    Frame energies are computed with numpy for a whole block at a time and only frames above
+    SILENCE_RMS are passed to webrtcvad. Returns a boolean array with one entry per full frame.
+    """
+    vad = webrtcvad.Vad(vad_mode)
+    frame_samples = SAMPLE_RATE * frame_ms // 1000
+    frame_bytes = frame_samples * 2
+    frame_count = len(pcm) // frame_samples
+    flags = np.zeros(frame_count, dtype=bool)
+
+    for block_start in range(0, frame_count, BLOCK_FRAMES):
+        block_end = min(block_start + BLOCK_FRAMES, frame_count)
+        block = np.ascontiguousarray(pcm[block_start * frame_samples:block_end * frame_samples]).reshape(-1, frame_samples)
+        rms = np.sqrt(np.mean(np.square(block, dtype=np.float32), axis=1))
+        raw = block.tobytes()
+        for i in np.flatnonzero(rms >= SILENCE_RMS):
+            flags[block_start + i] = vad.is_speech(raw[i * frame_bytes:(i + 1) * frame_bytes], SAMPLE_RATE)
+    return flags
+
+def _speech_regions(flags, min_silence_frames, padding_frames):
+    """[start, end) frame ranges of speech, padded and with pauses shorter than min_silence_frames bridged."""
+    speech = flags
+    if padding_frames > 0 and len(flags):
+        speech = np.convolve(flags.astype(np.int8), np.ones(2 * padding_frames + 1, dtype=np.int8), mode='same') > 0
+    edges = np.diff(np.concatenate(([0], speech.astype(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    if len(starts) > 1:
+        keep = starts[1:] - ends[:-1] >= min_silence_frames
+        starts = np.concatenate((starts[:1], starts[1:][keep]))
+        ends = np.concatenate((ends[:-1][keep], ends[-1:]))
+    return list(zip(starts.tolist(), ends.tolist()))
+
+def _split_region(flags, start, end, max_frames):
+    """Split a region longer than max_frames, preferring the last short pause in the second half of each piece."""
+    pieces = []
+    while end - start > max_frames:
+        window = flags[start + max_frames // 2:start + max_frames]
+        pauses = np.flatnonzero(~window)
+        cut = start + max_frames // 2 + pauses[-1] + 1 if len(pauses) else start + max_frames
+        pieces.append((start, cut))
+        start = cut
+    pieces.append((start, end))
+    return pieces
+
+def plan_speech_chunks(flags, total_samples, max_chunk_samples, min_silence_ms=500, padding_ms=200, frame_ms=FRAME_MS):
+    """
+    Group detected speech into chunks of at most max_chunk_samples.
+
+    Each chunk is a list of (start_sample, end_sample) spans of the original audio. Silence between
+    spans is left out, so a chunk is transcribed as the concatenation of its spans and its
+    timestamps are mapped back with chunk_time_to_source.
+    """
+    frame_samples = SAMPLE_RATE * frame_ms // 1000
+    max_frames = max(1, max_chunk_samples // frame_samples)
+    regions = _speech_regions(flags, max(1, min_silence_ms // frame_ms), padding_ms // frame_ms)
+
+    chunks = []
+    current = []
+    current_samples = 0
+    for region_start, region_end in regions:
+        for start, end in _split_region(flags, region_start, region_end, max_frames):
+            span = (start * frame_samples, total_samples if end == len(flags) else end * frame_samples)
+            span_samples = span[1] - span[0]
+            if current and current_samples + span_samples > max_chunk_samples:
+                chunks.append(current)
+                current = []
+                current_samples = 0
+            current.append(span)
+            current_samples += span_samples
+    if current:
+        chunks.append(current)
+    return chunks
+
+def read_spans(pcm, spans):
+    """The samples of a chunk: its spans concatenated, read from the memmap only now."""
+    return np.concatenate([pcm[start:end] for start, end in spans])
+
+def chunk_time_to_source(spans, seconds):
+    """Map a time in seconds within a chunk back to the time in the original audio."""
+    position = seconds * SAMPLE_RATE
+    for start, end in spans:
+        if position <= end - start:
+            return (start + position) / SAMPLE_RATE
+        position -= end - start
+    return spans[-1][1] / SAMPLE_RATE
@@ -0,0 +1,138 @@
+import hashlib
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import openai
+
+from audio.pcm_cache import SAMPLE_RATE, encode_opus
+from audio.vad_segmenter import chunk_time_to_source
+from gpt.openai_client import get_openai_client
+from utils.disk_cache import cache_key
+from utils.segment_checkpoint import append_checkpoint, assemble_transcription, load_checkpoint
+
+# The Whisper API accepts files up to 25 MB. Chunks are planned to fill SIZE_MARGIN of that at
+# the configured Opus bitrate, leaving room for container overhead and bitrate variation.
+API_FILE_LIMIT = 25 * 1024 * 1024
+SIZE_MARGIN = 0.9
+DEFAULT_BITRATE_KBPS = 24
+# Besides 5xx, these statuses are worth retrying: timeout, conflict and rate limit
+RETRYABLE_STATUS = (408, 409, 429)
+MAX_RETRY_DELAY = 60
+
+def create_whisper_client(base_url=None):
+    """Shared OpenAI client for the transcription endpoint; base_url can point at a local mock server."""
+    # Retries are done per chunk by transcribe_chunk_with_retries, with our own backoff
+    return get_openai_client(base_url=base_url or None, max_retries=0)
+
+def _is_retryable(error):
+    if isinstance(error, openai.APIConnectionError):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code in RETRYABLE_STATUS or error.status_code >= 500
+    return False
+
+def _retry_delay(error, attempt, base_delay):
+    # Honour the server's Retry-After when it gives one
+    if isinstance(error, openai.APIStatusError):
+        try:
+            return min(float(error.response.headers.get('retry-after')), MAX_RETRY_DELAY)
+        except (TypeError, ValueError):
+            pass
+    # Exponential backoff with jitter, so concurrent uploads do not retry in lockstep
+    return min(base_delay * 2 ** attempt, MAX_RETRY_DELAY) * random.uniform(0.5, 1)
+
+def max_chunk_samples(bitrate_kbps=DEFAULT_BITRATE_KBPS):
+    """Longest chunk, in 16 kHz samples, whose Opus encoding at bitrate_kbps stays under the upload limit."""
+    seconds = API_FILE_LIMIT * SIZE_MARGIN / (bitrate_kbps * 1000 / 8)
+    return int(seconds * SAMPLE_RATE)
+
+def spans_digest(pcm, spans):
+    """SHA-256 of a chunk's samples, hashed span by span straight from the memmap."""
+    digest = hashlib.sha256()
+    for start, end in spans:
+        digest.update(memoryview(pcm[start:end]).cast('B'))
+    return digest.digest()
+
+def transcribe_chunk_with_retries(logger, client, audio_bytes, file_name, whisper_model, max_retries=5, base_delay=1):
+    """Upload one audio file and return its segments, with times relative to the file."""
+    for attempt in range(max_retries + 1):
+        try:
+            response = client.audio.transcriptions.create(
+                model=whisper_model,
+                file=(file_name, audio_bytes),
+                response_format="verbose_json"
+            )
+            break
+        except openai.APIError as e:
+            if not _is_retryable(e) or attempt == max_retries:
+                raise
+            delay = _retry_delay(e, attempt, base_delay)
+            logger.warning(f"Whisper API request for {file_name} failed ({e}), retrying in {delay:.1f} s")
+            time.sleep(delay)
+
+    # Depending on the SDK version, verbose fields are typed models or plain dicts kept as extra fields
+    segments = [segment if isinstance(segment, dict) else segment.model_dump() for segment in getattr(response, 'segments', None) or []]
+    if not segments:
+        return [{'start': 0.0, 'end': getattr(response, 'duration', None) or 0.0, 'text': response.text}]
+    return [{'start': segment['start'], 'end': segment['end'], 'text': segment['text']} for segment in segments]
+
+def transcribe_with_api(logger, client, pcm, chunks, whisper_model, checkpoint_path, concurrency=4, max_retries=5,
+                        bitrate_kbps=DEFAULT_BITRATE_KBPS, cache=None, base_delay=1):
+    """
+    Transcribe chunks of 16 kHz PCM with the Whisper API, encoding and uploading up to `concurrency` at once.
+
+    Each chunk is a list of (start, end) sample spans, see max_chunk_samples for the size to plan them with.
+    Chunks are sent as mono Opus, finished chunks are checkpointed as they arrive and the transcription is
+    assembled in chunk order with segment times in the original audio. With a DiskCache, responses are
+    stored under a hash of the chunk's samples, bitrate and model, and a chunk that was sent before is
+    neither encoded nor sent again.
+    """
+    keys = [{'api': whisper_model, 'bitrate': bitrate_kbps, 'spans': [list(span) for span in spans]} for spans in chunks]
+    done = load_checkpoint(checkpoint_path, keys)
+    missing = [idx for idx in range(len(chunks)) if idx not in done]
+    if done:
+        logger.info(f"Resuming transcription, {len(done)} of {len(chunks)} chunks already done")
+
+    def transcribe_spans(idx):
+        spans = chunks[idx]
+        # Keyed on the samples, not the Ogg file, whose stream serial number changes with every encode
+        key = cache_key(whisper_model, bitrate_kbps, spans_digest(pcm, spans)) if cache is not None else None
+        segments = cache.get(key) if cache is not None else None
+        if segments is None:
+            # A chunk can be hours of audio, so its spans are streamed to the encoder instead of joined first
+            audio_bytes = encode_opus([pcm[start:end] for start, end in spans], bitrate_kbps)
+            if len(audio_bytes) > API_FILE_LIMIT:
+                raise RuntimeError(f"Chunk {idx + 1} encoded to {len(audio_bytes)} bytes, over the API limit; lower api_bitrate_kbps")
+            logger.debug(f"Uploading chunk {idx + 1}: {len(audio_bytes)} bytes")
+            segments = transcribe_chunk_with_retries(logger, client, audio_bytes, f"audio_chunk_{idx}.ogg", whisper_model, max_retries, base_delay)
+            if cache is not None:
+                cache.put(key, segments)
+        else:
+            logger.info(f"Chunk {idx + 1} served from the Whisper API cache")
+        for segment in segments:
+            segment['start'] = chunk_time_to_source(spans, segment['start'])
+            segment['end'] = chunk_time_to_source(spans, segment['end'])
+        return segments
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        futures = {executor.submit(transcribe_spans, idx): idx for idx in missing}
+        try:
+            for future in as_completed(futures):
+                idx = futures[future]
+                segments = future.result()
+                append_checkpoint(checkpoint_path, idx, keys[idx], segments)
+                done[idx] = segments
+                logger.info(f"Finished chunk {idx + 1} of {len(chunks)}")
+        except BaseException:
+            # Chunks not started yet are dropped, the finished ones stay in the checkpoint for the next attempt
+            for future in futures:
+                future.cancel()
+            raise
+
+    if cache is not None:
+        total_hits, total_misses = cache.total_stats()
+        logger.info(f"Whisper API cache: {cache.hits} hits, {cache.misses} misses in this run, "
+                    f"{total_hits} hits, {total_misses} misses in total")
+
+    return assemble_transcription([done[idx] for idx in range(len(chunks))], " ")
@@ -0,0 +1,50 @@
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+from audio.pcm_cache import pcm_to_float32
+from audio.transcribe_audio import load_whisper_model, transcribe_segments
+from audio.vad_segmenter import chunk_time_to_source, read_spans
+
+# Per-process state, set up once by _init_worker when the pool starts
+_model = None
+_logger = None
+
+def _init_worker(model_name, device_name, backend, compute_type, threads):
+    global _model, _logger
+    _logger = logging.getLogger("youtube_processing")
+    # Each worker gets its share of the cores instead of every process using all of them
+    _model = load_whisper_model(model_name, device_name, backend, compute_type, threads)
+
+def transcribe_chunk(logger, model, pcm, spans):
+    """Transcribe one chunk made of (start, end) sample spans, with segment times in the original audio."""
+    segments = transcribe_segments(logger, model, pcm_to_float32(read_spans(pcm, spans)))
+    for segment in segments:
+        segment['start'] = chunk_time_to_source(spans, segment['start'])
+        segment['end'] = chunk_time_to_source(spans, segment['end'])
+    return segments
+
+def _transcribe_spans(pcm_path, spans):
+    # Workers map the PCM file themselves, so only sample offsets cross the process boundary
+    pcm = np.memmap(pcm_path, dtype=np.int16, mode='r')
+    return transcribe_chunk(_logger, _model, pcm, spans)
+
+def threads_per_worker(workers):
+    return max(1, (os.cpu_count() or 1) // workers)
+
+def transcribe_chunks_parallel(logger, pcm_path, chunks, workers, model_name, device_name, backend, compute_type):
+    """
+    Transcribe chunks of the PCM cache at pcm_path with a pool of processes, each holding its own Whisper model.
+
+    Yields one list of segments per chunk, in chunk order, as soon as it and all chunks before it are done.
+    """
+    if not chunks:
+        return
+    workers = max(1, min(workers, len(chunks)))
+    threads = threads_per_worker(workers)
+    logger.info(f"Transcribing {len(chunks)} chunks with {workers} worker processes, {threads} threads each")
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(model_name, device_name, backend, compute_type, threads)) as executor:
+        yield from executor.map(_transcribe_spans, [pcm_path] * len(chunks), chunks)
@@ -0,0 +1,91 @@
+import argparse
+import configparser
+import os
+import re
+import tempfile
+import time
+import numpy as np
+
+from audio.pcm_cache import SAMPLE_RATE, decode_to_pcm, pcm_to_float32
+from audio.transcribe_audio import BACKENDS, load_whisper_model
+
+# Side-by-side comparison of the transcription backends. Fixtures are not shipped with the
+# repository: point --fixtures at a directory of audio files, each with a reference transcript
+# of the same name and a .txt extension (e.g. talk.mp3 and talk.txt).
+
+AUDIO_EXTENSIONS = ('.mp3', '.wav', '.m4a', '.flac', '.ogg', '.opus', '.webm')
+
+def normalize_words(text):
+    return re.findall(r"\w+(?:'\w+)?", text.lower())
+
+def word_error_rate(reference, hypothesis):
+    """Word-level edit distance between the transcripts divided by the number of reference words."""
+    ref = normalize_words(reference)
+    hyp = normalize_words(hypothesis)
+    previous = list(range(len(hyp) + 1))
+    for i, ref_word in enumerate(ref, 1):
+        current = [i] + [0] * len(hyp)
+        for j, hyp_word in enumerate(hyp, 1):
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ref_word != hyp_word))
+        previous = current
+    return previous[-1] / max(1, len(ref))
+
+def load_fixtures(fixtures_dir):
+    fixtures = []
+    for name in sorted(os.listdir(fixtures_dir)):
+        base, extension = os.path.splitext(name)
+        reference_path = os.path.join(fixtures_dir, base + '.txt')
+        if extension.lower() not in AUDIO_EXTENSIONS or not os.path.exists(reference_path):
+            continue
+        with tempfile.TemporaryDirectory() as temp_dir:
+            pcm_path = os.path.join(temp_dir, 'audio.pcm')
+            decode_to_pcm(os.path.join(fixtures_dir, name), pcm_path)
+            audio = pcm_to_float32(np.fromfile(pcm_path, dtype=np.int16))
+        with open(reference_path, 'r', encoding='utf-8') as f:
+            fixtures.append((name, audio, f.read()))
+    return fixtures
+
+def run_benchmark(fixtures, backends, model_name, device_name, compute_type):
+    rows = []
+    for backend in backends:
+        start_time = time.time()
+        model = load_whisper_model(model_name, device_name, backend, compute_type)
+        load_time = time.time() - start_time
+
+        for name, audio, reference in fixtures:
+            start_time = time.time()
+            segments = model.transcribe(audio)
+            elapsed = time.time() - start_time
+            hypothesis = ''.join(segment['text'] for segment in segments)
+            rows.append((backend, name, load_time, elapsed, elapsed / (len(audio) / SAMPLE_RATE), word_error_rate(reference, hypothesis)))
+    return rows
+
+def print_report(rows):
+    print(f"{'backend':<16} {'fixture':<32} {'load s':>8} {'time s':>8} {'RTF':>7} {'WER':>7}")
+    for backend, name, load_time, elapsed, rtf, wer in rows:
+        print(f"{backend:<16} {name[:32]:<32} {load_time:>8.2f} {elapsed:>8.2f} {rtf:>7.3f} {wer:>7.2%}")
+
+    print()
+    for backend in dict.fromkeys(row[0] for row in rows):
+        backend_rows = [row for row in rows if row[0] == backend]
+        mean_rtf = sum(row[4] for row in backend_rows) / len(backend_rows)
+        mean_wer = sum(row[5] for row in backend_rows) / len(backend_rows)
+        print(f"{backend:<16} mean RTF {mean_rtf:.3f}, mean WER {mean_wer:.2%}")
+
+### MAIN ###
+
+config = configparser.ConfigParser()
+config.read('config.ini')
+
+parser = argparse.ArgumentParser(description='Compare transcription backends on audio fixtures with reference transcripts.')
+parser.add_argument('-f', '--fixtures', type=str, required=True, help='Directory with audio files and matching .txt reference transcripts')
+parser.add_argument('-b', '--backends', type=str, nargs='+', default=list(BACKENDS), choices=list(BACKENDS), help='Backends to compare')
+parser.add_argument('-m', '--model', type=str, default=config.get('WHISPER', 'model_name'), help='Model name to load in every backend')
+parser.add_argument('--compute-type', type=str, default=config.get('WHISPER', 'compute_type', fallback='int8'), help='faster-whisper compute type')
+
+args = parser.parse_args()
+fixtures = load_fixtures(args.fixtures)
+if not fixtures:
+    parser.error(f"No audio files with reference transcripts found in {args.fixtures}")
+
+print_report(run_benchmark(fixtures, args.backends, args.model, config.get('WHISPER', 'device_name'), args.compute_type))
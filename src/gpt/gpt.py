@@ -1,16 +1,130 @@
-from openai import OpenAI
-from keys import OPENAI_API_KEY
-
-def get_completions(userMessage, model, max_tokens, temperature, systemMessage=""):
-    client = OpenAI(api_key=OPENAI_API_KEY)
-
-    response = client.chat.completions.create(
-        model=model,
-        messages=[
-            {"role": "system", "content": systemMessage},
-            {"role": "user", "content": userMessage}
-        ],
-        max_tokens=max_tokens,
-        temperature=temperature
-    )
-    return response.choices[0].message.content
+from gpt.openai_client import get_async_openai_client, get_openai_client
+from gpt.tokens import count_tokens
+from utils.disk_cache import cache_key
+
+# Optional DiskCache of completions, set by the entry scripts with set_completion_cache
+completion_cache = None
+
+# Optional RateLimiter shared by all processes, set with set_rate_limiter
+rate_limiter = None
+# Tokens the chat format adds per message on top of its content
+MESSAGE_OVERHEAD_TOKENS = 4
+
+def set_completion_cache(cache):
+    global completion_cache
+    completion_cache = cache
+
+def set_rate_limiter(limiter):
+    global rate_limiter
+    rate_limiter = limiter
+
+def estimate_tokens(userMessage, model, max_tokens, systemMessage=""):
+    """Upper bound of the tokens a request can use: its prompt plus the whole completion budget."""
+    return count_tokens(systemMessage, model) + count_tokens(userMessage, model) + 2 * MESSAGE_OVERHEAD_TOKENS + max_tokens
+
+def completion_cache_report():
+    """Hit rate of the completion cache in this process, for the log."""
+    if completion_cache is None:
+        return "Completion cache disabled"
+    hits, misses = completion_cache.hits, completion_cache.misses
+    total_hits, total_misses = completion_cache.total_stats()
+    hit_rate = hits / (hits + misses) if hits + misses else 0
+    total_hit_rate = total_hits / (total_hits + total_misses) if total_hits + total_misses else 0
+    return (f"Completion cache: {hits} hits, {misses} misses ({hit_rate:.0%}) in this run, "
+            f"{total_hit_rate:.0%} hit rate overall")
+
+def _cached_completion(key):
+    if key is None:
+        return None
+    return completion_cache.get(key)
+
+def _completion_key(userMessage, model, max_tokens, temperature, systemMessage):
+    if completion_cache is None:
+        return None
+    return cache_key(model, temperature, max_tokens, systemMessage, userMessage)
+
+def get_completions(userMessage, model, max_tokens, temperature, systemMessage="", validate=None):
+    """
+    Chat completion for one user message, served from the completion cache when possible.
+
+    validate(content), if given, must raise for an answer the caller cannot use; such answers are
+    not cached, so the next run asks again instead of failing on the same answer.
+    """
+    key = _completion_key(userMessage, model, max_tokens, temperature, systemMessage)
+    cached = _cached_completion(key)
+    if cached is not None:
+        return cached
+
+    messages = [
+        {"role": "system", "content": systemMessage},
+        {"role": "user", "content": userMessage}
+    ]
+    if rate_limiter is None:
+        response = get_openai_client().chat.completions.create(
+            model=model,
+            messages=messages,
+            max_tokens=max_tokens,
+            temperature=temperature
+        )
+    else:
+        # The limiter retries rate limited and failed calls itself, within the shared budget
+        client = get_openai_client(max_retries=0)
+        raw = rate_limiter.call(
+            model,
+            estimate_tokens(userMessage, model, max_tokens, systemMessage),
+            lambda: client.chat.completions.with_raw_response.create(
+                model=model,
+                messages=messages,
+                max_tokens=max_tokens,
+                temperature=temperature
+            ),
+            lambda raw: raw.parse().usage.total_tokens if raw.parse().usage else None
+        )
+        response = raw.parse()
+
+    content = response.choices[0].message.content
+    if validate is not None:
+        validate(content)
+    if key is not None:
+        completion_cache.put(key, content)
+    return content
+
+async def get_completions_async(userMessage, model, max_tokens, temperature, systemMessage="", validate=None):
+    """get_completions for asyncio code, so several calls can be awaited together."""
+    key = _completion_key(userMessage, model, max_tokens, temperature, systemMessage)
+    cached = _cached_completion(key)
+    if cached is not None:
+        return cached
+
+    messages = [
+        {"role": "system", "content": systemMessage},
+        {"role": "user", "content": userMessage}
+    ]
+    if rate_limiter is None:
+        response = await get_async_openai_client().chat.completions.create(
+            model=model,
+            messages=messages,
+            max_tokens=max_tokens,
+            temperature=temperature
+        )
+    else:
+        client = get_async_openai_client(max_retries=0)
+        raw = await rate_limiter.call_async(
+            model,
+            estimate_tokens(userMessage, model, max_tokens, systemMessage),
+            lambda: client.chat.completions.with_raw_response.create(
+                model=model,
+                messages=messages,
+                max_tokens=max_tokens,
+                temperature=temperature
+            ),
+            lambda raw: raw.parse().usage.total_tokens if raw.parse().usage else None
+        )
+        response = raw.parse()
+
+    content = response.choices[0].message.content
+    if validate is not None:
+        validate(content)
+    if key is not None:
+        completion_cache.put(key, content)
+    return content
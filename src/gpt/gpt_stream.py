@@ -1,17 +1,31 @@
-from openai import OpenAI
-from keys import OPENAI_API_KEY
+from gpt import gpt
+from gpt.openai_client import get_openai_client
 
 def get_completions_stream(userMessage, model, max_tokens, temperature, systemMessage=""):
-    client = OpenAI(api_key=OPENAI_API_KEY)
+    messages = [
+        {"role": "system", "content": systemMessage},
+        {"role": "user", "content": userMessage}
+    ]
+    if gpt.rate_limiter is None:
+        return get_openai_client().chat.completions.create(
+            model=model,
+            messages=messages,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            stream=True
+        )
 
-    response = client.chat.completions.create(
-        model=model,
-        messages=[
-            {"role": "system", "content": systemMessage},
-            {"role": "user", "content": userMessage}
-        ],
-        max_tokens=max_tokens,
-        temperature=temperature,
-        stream=True
+    # Usage is unknown until the stream ends, so the whole estimate stays reserved
+    client = get_openai_client(max_retries=0)
+    raw = gpt.rate_limiter.call(
+        model,
+        gpt.estimate_tokens(userMessage, model, max_tokens, systemMessage),
+        lambda: client.chat.completions.with_raw_response.create(
+            model=model,
+            messages=messages,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            stream=True
+        )
     )
-    return response
+    return raw.parse()
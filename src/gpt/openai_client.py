@@ -0,0 +1,53 @@
+import asyncio
+import threading
+import weakref
+
+import httpx
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient, DefaultHttpxClient, OpenAI
+
+from keys import OPENAI_API_KEY
+
+# One OpenAI client per process (per event loop for the async one), so every chat, streaming and
+# Whisper call reuses pooled keep-alive connections instead of a new TLS handshake per request.
+
+settings = {
+    'base_url': None,
+    'timeout': 600.0,
+    'connect_timeout': 10.0,
+    'max_connections': 20
+}
+clients = {}
+async_clients = weakref.WeakKeyDictionary()
+clients_lock = threading.Lock()
+
+def configure_openai(base_url=None, timeout=None, connect_timeout=None, max_connections=None):
+    """Set client options before the first call; base_url can point at a local stub server."""
+    for name, value in (('base_url', base_url), ('timeout', timeout),
+                        ('connect_timeout', connect_timeout), ('max_connections', max_connections)):
+        if value:
+            settings[name] = value
+
+def _client_options(base_url):
+    limits = httpx.Limits(max_connections=settings['max_connections'], max_keepalive_connections=settings['max_connections'])
+    timeout = httpx.Timeout(settings['timeout'], connect=settings['connect_timeout'])
+    return {'api_key': OPENAI_API_KEY, 'base_url': base_url or settings['base_url'], 'timeout': timeout}, limits
+
+def get_openai_client(base_url=None, max_retries=2):
+    """Shared synchronous client; safe to use from several threads."""
+    key = (base_url, max_retries)
+    with clients_lock:
+        if key not in clients:
+            options, limits = _client_options(base_url)
+            clients[key] = OpenAI(**options, max_retries=max_retries, http_client=DefaultHttpxClient(limits=limits))
+        return clients[key]
+
+def get_async_openai_client(base_url=None, max_retries=2):
+    """Shared AsyncOpenAI client for the running event loop, whose connections cannot be used from another loop."""
+    key = (base_url, max_retries)
+    loop = asyncio.get_running_loop()
+    with clients_lock:
+        loop_clients = async_clients.setdefault(loop, {})
+        if key not in loop_clients:
+            options, limits = _client_options(base_url)
+            loop_clients[key] = AsyncOpenAI(**options, max_retries=max_retries, http_client=DefaultAsyncHttpxClient(limits=limits))
+        return loop_clients[key]
@@ -0,0 +1,222 @@
+import asyncio
+import os
+import re
+import sqlite3
+import threading
+import time
+
+import openai
+
+# Requests-per-minute and tokens-per-minute buckets for each model, kept in SQLite so that every
+# process (summaries run as one subprocess per video) draws from the same budget. Waiting requests
+# queue in the same file and are served round-robin across jobs: the job served least recently
+# goes first, requests of one job in arrival order.
+
+# A waiter whose process has not polled for this long is considered dead and leaves the queue
+STALE_WAITER_SECONDS = 30
+MAX_POLL_SECONDS = 1
+MAX_ATTEMPTS = 5
+
+def parse_limits(value):
+    """Parse 'model:rpm:tpm, ...' from config into {model: (rpm, tpm)}."""
+    limits = {}
+    for item in value.split(','):
+        if item.strip():
+            model, rpm, tpm = item.strip().rsplit(':', 2)
+            limits[model] = (int(rpm), int(tpm))
+    return limits
+
+def parse_reset(value):
+    """Seconds from an x-ratelimit-reset-* header such as '20ms', '1.5s' or '6m0s'."""
+    units = {'h': 3600, 'm': 60, 's': 1, 'ms': 0.001}
+    return sum(float(amount) * units[unit] for amount, unit in re.findall(r'(\d+(?:\.\d+)?)(ms|h|m|s)', value or ''))
+
+class RateLimiter:
+    def __init__(self, path, limits, job=None):
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self.limits = dict(limits)
+        self.job = job or f"pid-{os.getpid()}"
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS buckets (
+                model TEXT PRIMARY KEY,
+                requests REAL NOT NULL,
+                tokens REAL NOT NULL,
+                blocked_until REAL NOT NULL DEFAULT 0,
+                updated_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS waiters (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                job TEXT NOT NULL,
+                model TEXT NOT NULL,
+                tokens INTEGER NOT NULL,
+                heartbeat REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS jobs (
+                job TEXT PRIMARY KEY,
+                last_served REAL NOT NULL
+            );
+        """)
+
+    def _transaction(self, work):
+        # BEGIN IMMEDIATE takes the write lock up front, so two processes never refill the same bucket;
+        # the thread lock does the same for threads sharing this connection
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = work(time.time())
+                self.conn.execute("COMMIT")
+                return result
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def _bucket(self, model, now):
+        """Current bucket levels, refilled for the time since the last update."""
+        rpm, tpm = self.limits[model]
+        row = self.conn.execute("SELECT requests, tokens, blocked_until, updated_at FROM buckets WHERE model = ?", (model,)).fetchone()
+        if row is None:
+            return rpm, tpm, 0
+        elapsed = max(0, now - row[3])
+        return min(rpm, row[0] + elapsed * rpm / 60), min(tpm, row[1] + elapsed * tpm / 60), row[2]
+
+    def _store(self, model, requests, tokens, blocked_until, now):
+        self.conn.execute("INSERT OR REPLACE INTO buckets (model, requests, tokens, blocked_until, updated_at) VALUES (?, ?, ?, ?, ?)",
+                          (model, requests, tokens, blocked_until, now))
+
+    def acquire(self, model, tokens):
+        """Block until one request and `tokens` tokens of model's budget are reserved. Models without limits pass."""
+        if model not in self.limits:
+            return 0
+        rpm, tpm = self.limits[model]
+        # A request larger than the whole minute's budget could never run otherwise
+        tokens = min(tokens, tpm)
+        waiter_id = self._transaction(lambda now: self.conn.execute(
+            "INSERT INTO waiters (job, model, tokens, heartbeat) VALUES (?, ?, ?, ?)", (self.job, model, tokens, now)).lastrowid)
+
+        def try_reserve(now):
+            self.conn.execute("DELETE FROM waiters WHERE heartbeat < ?", (now - STALE_WAITER_SECONDS,))
+            self.conn.execute("UPDATE waiters SET heartbeat = ? WHERE id = ?", (now, waiter_id))
+            head = self.conn.execute(
+                "SELECT w.id FROM waiters w LEFT JOIN jobs j ON j.job = w.job WHERE w.model = ? "
+                "ORDER BY COALESCE(j.last_served, 0), w.id LIMIT 1", (model,)).fetchone()
+            requests, available, blocked_until = self._bucket(model, now)
+            if head is None or head[0] != waiter_id:
+                return MAX_POLL_SECONDS / 10
+            if now < blocked_until:
+                return blocked_until - now
+            if requests < 1 or available < tokens:
+                return max((1 - requests) * 60 / rpm, (tokens - available) * 60 / tpm)
+
+            self._store(model, requests - 1, available - tokens, blocked_until, now)
+            self.conn.execute("DELETE FROM waiters WHERE id = ?", (waiter_id,))
+            self.conn.execute("INSERT OR REPLACE INTO jobs (job, last_served) VALUES (?, ?)", (self.job, now))
+            return None
+
+        try:
+            while True:
+                wait = self._transaction(try_reserve)
+                if wait is None:
+                    return tokens
+                time.sleep(min(max(wait, 0.01), MAX_POLL_SECONDS))
+        except BaseException:
+            self._transaction(lambda now: self.conn.execute("DELETE FROM waiters WHERE id = ?", (waiter_id,)))
+            raise
+
+    def release(self, model, reserved, used):
+        """Return the part of a reservation the request did not use."""
+        if model not in self.limits or used is None or used >= reserved:
+            return
+
+        def refund(now):
+            requests, tokens, blocked_until = self._bucket(model, now)
+            self._store(model, requests, min(self.limits[model][1], tokens + reserved - used), blocked_until, now)
+        self._transaction(refund)
+
+    def update_from_headers(self, model, headers, rate_limited=False):
+        """Align the bucket with the x-ratelimit-* headers of a response; after a 429, pause until the reset."""
+        if model not in self.limits:
+            return
+        rpm, tpm = self.limits[model]
+        # Adopt the server's limits when they are lower than configured
+        try:
+            self.limits[model] = (min(rpm, int(headers.get('x-ratelimit-limit-requests'))),
+                                  min(tpm, int(headers.get('x-ratelimit-limit-tokens'))))
+        except (TypeError, ValueError):
+            pass
+
+        def adjust(now):
+            requests, tokens, blocked_until = self._bucket(model, now)
+            try:
+                requests = min(requests, float(headers.get('x-ratelimit-remaining-requests')))
+            except (TypeError, ValueError):
+                pass
+            try:
+                tokens = min(tokens, float(headers.get('x-ratelimit-remaining-tokens')))
+            except (TypeError, ValueError):
+                pass
+            if rate_limited:
+                try:
+                    pause = float(headers.get('retry-after'))
+                except (TypeError, ValueError):
+                    pause = max(parse_reset(headers.get('x-ratelimit-reset-requests')),
+                                parse_reset(headers.get('x-ratelimit-reset-tokens')), 1)
+                blocked_until = max(blocked_until, now + pause)
+                tokens = min(tokens, 0)
+            self._store(model, requests, tokens, blocked_until, now)
+        self._transaction(adjust)
+
+    def call(self, model, tokens, create, used_tokens=None):
+        """
+        Run create() (a with_raw_response call) within model's budget and return the raw response.
+
+        used_tokens(raw), if given, reports the actual usage so the rest of the reservation is returned.
+        429s update the shared bucket and are retried once the budget allows; connection errors and
+        server errors are retried with exponential backoff.
+        """
+        for attempt in range(MAX_ATTEMPTS):
+            reserved = self.acquire(model, tokens)
+            try:
+                raw = create()
+            except openai.RateLimitError as e:
+                self.update_from_headers(model, e.response.headers, rate_limited=True)
+                if attempt == MAX_ATTEMPTS - 1:
+                    raise
+                continue
+            except (openai.APIConnectionError, openai.InternalServerError):
+                self.release(model, reserved, 0)
+                if attempt == MAX_ATTEMPTS - 1:
+                    raise
+                time.sleep(2 ** attempt)
+                continue
+            # Refund first, the headers then cap the bucket at what the server says is left
+            if used_tokens is not None:
+                self.release(model, reserved, used_tokens(raw))
+            self.update_from_headers(model, raw.headers)
+            return raw
+
+    async def call_async(self, model, tokens, create, used_tokens=None):
+        """call() for asyncio code: create() returns an awaitable, and the SQLite work and waits run off the event loop."""
+        for attempt in range(MAX_ATTEMPTS):
+            reserved = await asyncio.to_thread(self.acquire, model, tokens)
+            try:
+                raw = await create()
+            except openai.RateLimitError as e:
+                await asyncio.to_thread(self.update_from_headers, model, e.response.headers, True)
+                if attempt == MAX_ATTEMPTS - 1:
+                    raise
+                continue
+            except (openai.APIConnectionError, openai.InternalServerError):
+                await asyncio.to_thread(self.release, model, reserved, 0)
+                if attempt == MAX_ATTEMPTS - 1:
+                    raise
+                await asyncio.sleep(2 ** attempt)
+                continue
+            if used_tokens is not None:
+                await asyncio.to_thread(self.release, model, reserved, used_tokens(raw))
+            await asyncio.to_thread(self.update_from_headers, model, raw.headers)
+            return raw
@@ -0,0 +1,68 @@
+from bisect import bisect_left
+from functools import lru_cache
+
+import tiktoken
+
+from utils.utils import find_nearest_sentence_boundary
+
+# A chunk cut at a sentence boundary must keep at least this part of its token budget
+MIN_CHUNK_FRACTION = 0.5
+
+@lru_cache(maxsize=None)
+def get_encoding(model):
+    """Tokenizer for model, built once per process."""
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        # Models tiktoken does not know yet use the encoding of the current GPT-4o family
+        return tiktoken.get_encoding("o200k_base")
+
+def count_tokens(text, model):
+    return len(get_encoding(model).encode(text))
+
+def plan_token_chunks(text, model, token_limit, overlap_percentage):
+    """
+    Split text into (start, end) character ranges of at most token_limit tokens each.
+    Returns the ranges and the number of tokens in the whole text.
+
+    The text is tokenized once; token start offsets map the budget back to characters. Chunks end
+    at the last sentence boundary within the budget, unless that would leave the chunk shorter than
+    MIN_CHUNK_FRACTION of the budget or not past the previous chunk's end; then they end at the token
+    limit. Each chunk after the first starts about overlap_percentage of the budget before the previous
+    chunk's end, at a sentence boundary when there is one nearby.
+    """
+    encoding = get_encoding(model)
+    tokens = encoding.encode(text)
+    if len(tokens) <= token_limit:
+        return [(0, len(text))], len(tokens)
+
+    _, offsets = encoding.decode_with_offsets(tokens)
+    offsets.append(len(text))
+    overlap_tokens = int(token_limit * overlap_percentage)
+    min_chunk_tokens = int(token_limit * MIN_CHUNK_FRACTION)
+
+    chunks = []
+    start_token = 0
+    previous_end = 0
+    while len(tokens) - start_token > token_limit:
+        start = offsets[start_token]
+        limit = offsets[start_token + token_limit]
+        end = find_nearest_sentence_boundary(text, limit, -1)
+        if end <= max(start, previous_end) or bisect_left(offsets, end) - start_token < min_chunk_tokens:
+            end = limit
+        chunks.append((start, end))
+        previous_end = end
+
+        end_token = bisect_left(offsets, end)
+        if end_token - start_token <= overlap_tokens:
+            start_token = end_token
+            continue
+        overlap_token = end_token - overlap_tokens
+        next_start = find_nearest_sentence_boundary(text, offsets[overlap_token], -1)
+        # A boundary further back than twice the overlap would repeat most of the previous chunk
+        if next_start < offsets[max(start_token, end_token - 2 * overlap_tokens)]:
+            next_start = offsets[overlap_token]
+        start_token = max(start_token + 1, bisect_left(offsets, next_start))
+
+    chunks.append((offsets[start_token], len(text)))
+    return chunks, len(tokens)
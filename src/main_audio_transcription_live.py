@@ -1,56 +1,78 @@
 import os
+import time
 import tkinter as tk
 import configparser
 from tkinter import scrolledtext
 from tkinter import font
 import pyaudiowpatch as pyaudio
-import whisper
 import threading
 import queue
 import webrtcvad
 import logging
+import numpy as np
 
+from utils.disk_cache import DiskCache
 from utils.logging_setup import setup_logging
-from audio.convert_audio_to_16000hz import convert_audio_to_16000hz
 from utils.utils import change_font_size, find_sentences, get_random_color
-from gpt.gpt import get_completions
+from gpt.gpt import completion_cache_report, get_completions, set_completion_cache, set_rate_limiter
 from gpt.gpt_stream import get_completions_stream
+from gpt.openai_client import configure_openai
+from gpt.rate_limiter import RateLimiter, parse_limits
 from audio.pyaudio_manager import get_device_info, get_stream, initialize_pyaudio
-from audio.frame_validator import is_valid_frame, to_mono
+from audio.frame_validator import is_valid_frame
+from audio.resampler import AudioRingBuffer, StreamingResampler
 from audio.save_wav import save_wav
-from audio.transcribe_audio import transcribe_audio
+from audio.transcribe_audio import DEFAULT_BACKEND, load_whisper_model, transcribe_audio
+from audio.transcription_client import TranscriptionClient
 
 ### FUNCTIONS ###
 
 def read_stream(stream, chunk, frame_rate, shared_queue):
     vad = webrtcvad.Vad(vad_mode)
-    frames = []
+    resampler = StreamingResampler(frame_rate, SAMPLE_RATE, channel)
+    # Preallocated scratch buffers for converting each 10 ms VAD frame to 16-bit samples
+    vad_samples = np.zeros(VAD_FRAME_SAMPLES, dtype=np.float32)
+    vad_frame = np.zeros(VAD_FRAME_SAMPLES, dtype=np.int16)
+    chunk_start = 0
+    vad_position = 0
     silent_frames = 0
+    convert_time = 0
     while still_listening:
         data = stream.read(chunk)
-        mono_frame = to_mono(data)
-        is_speech = False
-        if is_valid_frame(mono_frame, frame_rate, 10):
-            is_speech = vad.is_speech(mono_frame, frame_rate)
-        else:
-            logger.error("Invalid frame")
-
-        frames.append(data)
-
-        if not is_speech:
-            silent_frames += 1
-        else:
-            silent_frames = 0
 
-        # Check if the accumulated frames exceed the desired record_seconds
+        start_time = time.time()
+        ring_buffer.write(resampler.process(data))
+        convert_time += time.time() - start_time
+
+        # Run VAD over every complete 10 ms frame of the resampled 16 kHz audio
+        while ring_buffer.written - vad_position >= VAD_FRAME_SAMPLES:
+            np.multiply(ring_buffer.get(vad_position, vad_position + VAD_FRAME_SAMPLES), np.iinfo(np.int16).max, out=vad_samples)
+            np.clip(vad_samples, np.iinfo(np.int16).min, np.iinfo(np.int16).max, out=vad_samples)
+            vad_frame[:] = vad_samples
+            mono_frame = vad_frame.tobytes()
+            vad_position += VAD_FRAME_SAMPLES
+
+            is_speech = False
+            if is_valid_frame(mono_frame, SAMPLE_RATE, 10):
+                is_speech = vad.is_speech(mono_frame, SAMPLE_RATE)
+            else:
+                logger.error("Invalid frame")
+
+            if not is_speech:
+                silent_frames += 1
+            else:
+                silent_frames = 0
+
+        # Check if the accumulated samples exceed the desired record_seconds
         # and if there is enough silence indicating the end of a sentence
-        if len(frames) * chunk >= frame_rate * record_seconds and silent_frames >= required_silence_length\
-            or len(frames) * chunk >= frame_rate * max_record_seconds:
-            all_frames = b''.join(frames)
-            logger.info("processing chunk of duration: " + str(len(all_frames) / frame_rate / channel / 2) + " sec")
-            shared_queue.put(all_frames)
-            frames.clear()
+        chunk_samples = ring_buffer.written - chunk_start
+        if chunk_samples >= SAMPLE_RATE * record_seconds and silent_frames >= required_silence_length\
+            or chunk_samples >= SAMPLE_RATE * max_record_seconds:
+            logger.info("processing chunk of duration: " + str(chunk_samples / SAMPLE_RATE) + " sec")
+            shared_queue.put((chunk_start, ring_buffer.written, convert_time))
+            chunk_start = ring_buffer.written
             silent_frames = 0
+            convert_time = 0
 
 def process_audio(shared_queue: queue):
     from datetime import datetime
@@ -61,19 +83,39 @@ def process_audio(shared_queue: queue):
     if not os.path.exists(records_dir):
         os.makedirs(records_dir)
     while True:
-        all_frames = shared_queue.get()
-        if all_frames is None:  # None is used as a signal to stop the thread
+        item = shared_queue.get()
+        if item is None:  # None is used as a signal to stop the thread
             break
 
-        logger.debug("converting chunk")
-        converted_buffer, audio = convert_audio_to_16000hz(logger, frame_rate, all_frames)
+        start, end, convert_time = item
+        if not ring_buffer.is_available(start):
+            logger.error("Chunk was overwritten before it could be transcribed, increase ring_buffer_seconds")
+            shared_queue.task_done()
+            continue
+
+        # Resampling already happened frame by frame in read_stream, this is only its accumulated cost
+        logger.debug(f"Convert time: {convert_time * 1000} milliseconds")
+        audio = ring_buffer.get(start, end)
 
+        wav_path = os.path.join(records_dir, "out_"+str(iter)+".wav")
         if save_wav_enabled:
             logger.debug("saving chunk")
-            save_wav(p_audio, 1, 16000, audio_format, converted_buffer, os.path.join(records_dir, "out_"+str(iter)+".wav"))
+            converted_buffer = (np.clip(audio, -1, 1) * np.iinfo(np.int16).max).astype(np.int16).tobytes()
+            save_wav(p_audio, 1, SAMPLE_RATE, audio_format, converted_buffer, wav_path)
 
         logger.debug("transcribing chunk")
-        texts = transcribe_audio(logger, model, audio)
+        if transcription_client is not None:
+            texts = [segment['text'] for segment in transcription_client.transcribe_pcm(audio)]
+        else:
+            texts = transcribe_audio(logger, model, audio)
+
+        # audio is a view into the ring buffer, which read_stream may have lapped while it was in use
+        if not ring_buffer.is_available(start):
+            logger.error("Chunk was overwritten while it was transcribed, increase ring_buffer_seconds")
+            if save_wav_enabled and os.path.exists(wav_path):
+                os.remove(wav_path)
+            shared_queue.task_done()
+            continue
 
         transcription_queue.put(''.join(texts))
         logger.debug(texts)
@@ -319,20 +361,44 @@ audio_format = pyaudio.paInt16
 required_silence_length = config.getint('RECORDING', 'required_silence_length')
 save_wav_enabled = config.getboolean('RECORDING', 'save_wav')
 vad_mode = config.getint('RECORDING', 'vad_mode')
+ring_buffer_seconds = config.getint('RECORDING', 'ring_buffer_seconds', fallback=4 * max_record_seconds)
 
+openai_base_url = config.get('OPENAI', 'base_url', fallback='')
+openai_timeout = config.getfloat('OPENAI', 'request_timeout', fallback=600)
+openai_connect_timeout = config.getfloat('OPENAI', 'connect_timeout', fallback=10)
+openai_max_connections = config.getint('OPENAI', 'max_connections', fallback=20)
+configure_openai(openai_base_url, openai_timeout, openai_connect_timeout, openai_max_connections)
 gpt_streaming = config.getboolean('GPT', 'gpt_streaming')
 gpt_model = config.get('GPT', 'gpt_model')
 gpt_temperature = config.getfloat('GPT', 'gpt_temperature')
 gpt_maxtokens = config.getint('GPT', 'gpt_maxtokens')
+cache_enabled = config.getboolean('GPT', 'cache_enabled', fallback=True)
+cache_path = config.get('GPT', 'cache_path', fallback='data/completion_cache.sqlite')
+cache_max_mb = config.getint('GPT', 'cache_max_mb', fallback=100)
+cache_max_age_days = config.getfloat('GPT', 'cache_max_age_days', fallback=30)
+rate_limits = parse_limits(config.get('GPT', 'rate_limits', fallback=''))
+rate_limit_path = config.get('GPT', 'rate_limit_path', fallback='data/rate_limits.sqlite')
 
 font_name = config.get('VISUAL', 'font_name')
 font_size = config.getint('VISUAL', 'font_size')
 
 model_name = config.get('WHISPER', 'model_name')
 device_name = config.get('WHISPER', 'device_name')
+whisper_backend = config.get('WHISPER', 'backend', fallback=DEFAULT_BACKEND)
+compute_type = config.get('WHISPER', 'compute_type', fallback='int8')
+use_server = config.getboolean('WHISPER', 'use_server', fallback=False)
+server_url = config.get('WHISPER', 'server_url', fallback='http://127.0.0.1:8765')
 
 prompts = []
 
+# Shared with main_gpt_summary.py; only non-streaming completions are cached
+if cache_enabled:
+    set_completion_cache(DiskCache(cache_path, cache_max_mb * 1024 * 1024, cache_max_age_days * 86400))
+
+# Draws from the same per-model budget as summaries running in the background
+if rate_limits:
+    set_rate_limiter(RateLimiter(rate_limit_path, rate_limits, job="live"))
+
 init_prompts_from_config(config, prompts)
 
 # Set up logging
@@ -354,11 +420,24 @@ logger.debug(f"Recording from: ({default_speakers['index']}){default_speakers['n
 logger.debug("Frame rate: " + str(frame_rate) + ", Channels: " + str(channel) + ", Chunk size is " + str(chunk_size))
 stream = get_stream(p_audio, audio_format, channel, frame_rate, chunk_size, input_index)
 
-logger.info('loading model')
-if device_name == 'gpu':
-    model = whisper.load_model(model_name)
-else:
-    model = whisper.load_model(model_name, device=device_name)
+# Captured audio is resampled to 16 kHz mono as it arrives and kept here until transcribed
+SAMPLE_RATE = 16000
+VAD_FRAME_SAMPLES = SAMPLE_RATE // 100
+ring_buffer = AudioRingBuffer(SAMPLE_RATE * ring_buffer_seconds)
+
+# A running transcription server already has the model loaded, so startup skips loading it here
+transcription_client = None
+model = None
+if use_server:
+    transcription_client = TranscriptionClient(server_url, model_name)
+    if transcription_client.is_available():
+        logger.info(f"Using transcription server at {server_url}")
+    else:
+        logger.warning(f"Transcription server at {server_url} is not available, loading the model locally")
+        transcription_client = None
+if transcription_client is None:
+    logger.info('loading model')
+    model = load_whisper_model(model_name, device_name, whisper_backend, compute_type)
 
 # Shared queue for communication between threads
 shared_queue = queue.Queue()
@@ -378,6 +457,7 @@ thread1.join()
 thread2.join()
 
 logger.info("stop")
+logger.info(completion_cache_report())
 logger.info(''.join(conversation))
 stream.stop_stream()
 stream.close()
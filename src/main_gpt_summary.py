@@ -2,13 +2,17 @@ import configparser
 import argparse
 import logging
 import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-import tiktoken
 
+from utils.disk_cache import DiskCache
 from utils.logging_setup import setup_logging
-from gpt.gpt import get_completions
+from gpt.gpt import completion_cache_report, get_completions, set_completion_cache, set_rate_limiter
+from gpt.openai_client import configure_openai
+from gpt.rate_limiter import RateLimiter, parse_limits
+from gpt.tokens import plan_token_chunks
 from utils.utils import (
-    find_nearest_sentence_boundary,
     read_transcription_file,
     read_prompt_template,
     save_as_json_to_file
@@ -24,42 +28,57 @@ part_prompt_file_path = 'part_prompt.txt'
 part_summary_prompt_file_path = 'part_summary_prompt.txt'
 summary_file_name = 'summary.json'
 summary_md_file_name = 'summary.md'
+def limited_completions(prompt, model, max_tokens, temperature, validate=None):
+    # All summary calls go through here, however many threads are waiting on them
+    with request_semaphore:
+        return get_completions(prompt, model, max_tokens, temperature, validate=validate)
+
+def parse_summary_json(summary_json):
+    summary_data = json.loads(summary_json)
+    missing = [field for field in (description_field, category_field) if field not in summary_data]
+    if missing:
+        raise ValueError(f"Summary JSON is missing {', '.join(missing)}")
+    return summary_data
+
 def divide_transcription(transcription, model, max_tokens, temperature):
     divide_prompt = read_prompt_template(divide_prompt_file_path)
     prompt = divide_prompt.replace("{transcription}", transcription)
-    parts = get_completions(prompt, model, max_tokens, temperature)
+    parts = limited_completions(prompt, model, max_tokens, temperature)
     return parts.split("\n\n")  # Assuming parts are separated by double newlines
 
 def generate_summary(transcription, title, prompt_template, model, max_tokens, temperature):
-    # Divide the transcription into parts
-    parts = divide_transcription(transcription, model, max_tokens, temperature)
-    logger.debug(f"Parts:\n{parts}")
-    
-    # Generate full document summary
-    summary_data = get_summary_data(transcription, title, prompt_template, model, max_tokens, temperature)
-
-    # Read part prompt template
-    description = summary_data[description_field]
-    part_prompt_template = read_prompt_template(part_prompt_file_path).replace("{description}", description)
-    part_summaries = []
-    for part in parts:
-        part_prompt = part_prompt_template.replace("{full_summary}", description).replace("{part}", part)
-        part_summary = get_completions(part_prompt, model, max_tokens, temperature)
-        part_summaries.append(part_summary)
+    with ThreadPoolExecutor(max_workers=max_concurrent_requests) as executor:
+        # Dividing into parts and the full document summary do not depend on each other
+        parts_future = executor.submit(divide_transcription, transcription, model, max_tokens, temperature)
+        summary_future = executor.submit(get_summary_data, transcription, title, prompt_template, model, max_tokens, temperature)
+        parts = parts_future.result()
+        logger.debug(f"Parts:\n{parts}")
+        summary_data = summary_future.result()
+
+        # Read part prompt template
+        description = summary_data[description_field]
+        part_prompt_template = read_prompt_template(part_prompt_file_path).replace("{description}", description)
+
+        # All parts are summarized at once, map keeps them in document order
+        def summarize_part(part):
+            part_prompt = part_prompt_template.replace("{full_summary}", description).replace("{part}", part)
+            return limited_completions(part_prompt, model, max_tokens, temperature)
+
+        part_summaries = list(executor.map(summarize_part, parts))
     
     # Generate a single summary from part summaries
     part_summaries_text = "\n".join(part_summaries)
     part_summary_prompt = read_prompt_template(part_summary_prompt_file_path).replace("{part_summaries}", part_summaries_text)
-    full_summary = get_completions(part_summary_prompt, model, max_tokens, temperature)
+    full_summary = limited_completions(part_summary_prompt, model, max_tokens, temperature)
     
     summary_data[summary_field] = full_summary
     return summary_data
 
 def get_summary_data(transcription, title, prompt_template, model, max_tokens, temperature):
     full_prompt = prompt_template.replace("{transcription}", transcription).replace("{title}", title)
-    full_summary_json = get_completions(full_prompt, model, max_tokens, temperature)
-    summary_data = json.loads(full_summary_json)
-    return summary_data
+    # Malformed answers are not cached, so a re-run asks again instead of failing the same way
+    full_summary_json = limited_completions(full_prompt, model, max_tokens, temperature, validate=parse_summary_json)
+    return parse_summary_json(full_summary_json)
 
 def replace_summarized_if_needed(prompt_template, summary_data, title, model, maxtokens, temperature):
     dagger_index = summary_data[description_field].find(separator_char, 0)
@@ -70,32 +89,28 @@ def replace_summarized_if_needed(prompt_template, summary_data, title, model, ma
         summary_data[description_field] = new_summary_data[description_field]
         summary_data[category_field] = new_summary_data[category_field]
 
-def count_tokens(text, model):
-    tokenizer = tiktoken.encoding_for_model(model)
-    tokens = tokenizer.encode(text)
-    return len(tokens)
-
-def generate_summary_recursive(transcription, title, prompt_template, model, max_tokens, temperature, token_limit, overlap_percentage):
-    transcription_tokens = count_tokens(transcription, model)
-    
-    if transcription_tokens <= token_limit:
+def generate_summary_chunked(transcription, title, prompt_template, model, max_tokens, temperature, token_limit, overlap_percentage):
+    chunks, token_count = plan_token_chunks(transcription, model, token_limit, overlap_percentage)
+    if len(chunks) == 1:
         return generate_summary(transcription, title, prompt_template, model, max_tokens, temperature)
 
-    logger.info(f"Transcription has {transcription_tokens} tokens ({transcription_tokens - token_limit} above than limit)")
-    midpoint = len(transcription) // 2
-    overlap_size = int(len(transcription) * overlap_percentage)
-    part1_end = find_nearest_sentence_boundary(transcription, midpoint + overlap_size, 1)
-    part2_start = find_nearest_sentence_boundary(transcription, midpoint - overlap_size, -1)
-
-    part1 = transcription[:part1_end]
-    part2 = transcription[part2_start:]
+    logger.info(f"Transcription has {token_count} tokens, summarizing it in {len(chunks)} chunks of up to {token_limit} tokens")
+    # Chunks are summarized in parallel; the request semaphore keeps the number of calls in flight bounded
+    with ThreadPoolExecutor(max_workers=len(chunks)) as executor:
+        summaries = list(executor.map(
+            lambda chunk: generate_summary(transcription[chunk[0]:chunk[1]], title, prompt_template, model, max_tokens, temperature),
+            chunks))
 
-    summary_part1 = generate_summary_recursive(part1, title, prompt_template, model, max_tokens, temperature, token_limit, overlap_percentage)
-    summary_part2 = generate_summary_recursive(part2, title, prompt_template, model, max_tokens, temperature, token_limit, overlap_percentage)
+    return reduce_summaries(summaries)
 
-    combined_summary = merge_summaries(summary_part1, summary_part2)
-    
-    return combined_summary
+def reduce_summaries(summaries):
+    """Merge chunk summaries pairwise, level by level, keeping document order."""
+    while len(summaries) > 1:
+        merged = [merge_summaries(summaries[i], summaries[i + 1]) for i in range(0, len(summaries) - 1, 2)]
+        if len(summaries) % 2:
+            merged.append(summaries[-1])
+        summaries = merged
+    return summaries[0]
 
 def merge_summaries(summary_part1, summary_part2):
     combined_description = summary_part1[description_field] + separator_char + summary_part2[description_field]
@@ -111,28 +126,51 @@ def merge_summaries(summary_part1, summary_part2):
 # INIT
 config = configparser.ConfigParser()
 config.read('config.ini')
+openai_base_url = config.get('OPENAI', 'base_url', fallback='')
+openai_timeout = config.getfloat('OPENAI', 'request_timeout', fallback=600)
+openai_connect_timeout = config.getfloat('OPENAI', 'connect_timeout', fallback=10)
+openai_max_connections = config.getint('OPENAI', 'max_connections', fallback=20)
+configure_openai(openai_base_url, openai_timeout, openai_connect_timeout, openai_max_connections)
 gpt_model = config.get('GPT', 'gpt_model')
 gpt_maxtokens = config.getint('GPT', 'gpt_maxtokens')
 gpt_temperature = config.getfloat('GPT', 'gpt_temperature')
 logging_level = getattr(logging, config['LOGGING']['logging_level'])
 token_limit = config.getint('PROCESSING', 'token_limit')
 overlap_percentage = config.getfloat('PROCESSING', 'overlap_percentage')
+max_concurrent_requests = config.getint('GPT', 'max_concurrent_requests', fallback=4)
+request_semaphore = threading.BoundedSemaphore(max_concurrent_requests)
+cache_enabled = config.getboolean('GPT', 'cache_enabled', fallback=True)
+cache_path = config.get('GPT', 'cache_path', fallback='data/completion_cache.sqlite')
+cache_max_mb = config.getint('GPT', 'cache_max_mb', fallback=100)
+cache_max_age_days = config.getfloat('GPT', 'cache_max_age_days', fallback=30)
+rate_limits = parse_limits(config.get('GPT', 'rate_limits', fallback=''))
+rate_limit_path = config.get('GPT', 'rate_limit_path', fallback='data/rate_limits.sqlite')
 # Set up logging
 logger = setup_logging("youtube_processing", logging_level)
 
 parser = argparse.ArgumentParser(description='Script to generate a summary from a transcription.')
 parser.add_argument('-f', '--file', type=str, required=True, help='Path to the input text file.')
+parser.add_argument('--no-cache', action='store_true', help='Bypass the completion cache and call the API for every prompt')
 args = parser.parse_args()
 input_file_path = args.file
 
+# Unchanged prompts from an earlier run are answered from disk
+if cache_enabled and not args.no_cache:
+    set_completion_cache(DiskCache(cache_path, cache_max_mb * 1024 * 1024, cache_max_age_days * 86400))
+
+# Budget shared with every other summary running on this machine; each video is its own job in the fair queue
+if rate_limits:
+    set_rate_limiter(RateLimiter(rate_limit_path, rate_limits, job=str(Path(input_file_path).parent)))
+
 # FILES
 url, title, _, transcription = read_transcription_file(input_file_path)
 prompt_template = read_prompt_template(summary_prompt_file_path)
 
 # SUMMARY
-summary_data = generate_summary_recursive(transcription, title, prompt_template, gpt_model, gpt_maxtokens, gpt_temperature, token_limit, overlap_percentage)
+summary_data = generate_summary_chunked(transcription, title, prompt_template, gpt_model, gpt_maxtokens, gpt_temperature, token_limit, overlap_percentage)
 replace_summarized_if_needed(prompt_template, summary_data, title, gpt_model, gpt_maxtokens, gpt_temperature)
 logger.debug(summary_data)
+logger.info(completion_cache_report())
 output_file_path_json = Path(input_file_path).with_name(summary_file_name)
 save_as_json_to_file(json.dumps(summary_data), output_file_path_json)
 
@@ -1,18 +1,20 @@
 import argparse
 import configparser
-import io
 import logging
 import os
-import whisper
-
-from openai import OpenAI
-from pydub import AudioSegment
-
-from audio.audio_manager import download_audio_as_bytes, get_title_author, split_audio
-from audio.convert_audio_to_16000hz import convert_audio_to_16000hz
-from keys import OPENAI_API_KEY
-from audio.transcribe_audio import transcribe_audio
-from utils.utils import get_data_folder, hash_url, save_transcription_to_file
+import time
+
+from audio.audio_manager import download_audio_to_file, get_title_author
+from audio.pcm_cache import PCM_FILE_NAME, SAMPLE_RATE, load_pcm
+from audio.transcribe_audio import DEFAULT_BACKEND, load_whisper_model
+from audio.transcription_client import TranscriptionClient
+from audio.vad_segmenter import detect_speech, plan_speech_chunks
+from audio.whisper_api import DEFAULT_BITRATE_KBPS, create_whisper_client, max_chunk_samples, transcribe_with_api
+from audio.whisper_pool import transcribe_chunk, transcribe_chunks_parallel
+from gpt.openai_client import configure_openai
+from utils.disk_cache import DiskCache
+from utils.segment_checkpoint import SEGMENTS_FILE_NAME, append_checkpoint, assemble_transcription, load_checkpoint
+from utils.utils import get_data_folder, read_video_info, resolve_cache_folder, save_transcription_to_file, save_video_info
 from utils.logging_setup import setup_logging
 
 def get_audio_data(url, folder, filename, client):
@@ -21,83 +23,74 @@ def get_audio_data(url, folder, filename, client):
     author = None
     if os.path.exists(file_path):
         logger.info(f"File '{file_path}' already exists. Loading from disk.")
-        with open(file_path, 'rb') as f:
-            audio_data = f.read()
+        title, author = read_video_info(folder)
+        if title is None:
             title, author = get_title_author(url)
     else:
         logger.info(f'Downloading {url}')
-        audio_data, title, author = download_audio_as_bytes(url, client=client)
-        if audio_data:
-            logger.info(f'Downloaded {len(audio_data)} bytes of audio.')
-            with open(file_path, 'wb') as f:
-                f.write(audio_data)
-            logger.info(f'File saved as {file_path}.')
-        else:
-            logger.error(f"Failed to download audio from {url}")
+        try:
+            downloaded_bytes, title, author = download_audio_to_file(url, file_path, client=client)
+        except Exception as e:
+            logger.error(f"Failed to download audio from {url}: {e}")
             exit()
-    return audio_data, title, author
-
-def process_audio(audio_data):
-    transcription_result = ""
-    frame_rate = 44000
-
-    chunks = split_audio(audio_data, chunk_duration_ms=chunk_duration_ms)
-
-    for idx, chunk in enumerate(chunks):
-        logger.info(f"Processing chunk {idx + 1} of {len(chunks)}")
-
-        logger.debug("Converting chunk to 16000Hz")
-        _, audio = convert_audio_to_16000hz(logger, frame_rate, chunk.raw_data)
-
-        logger.debug("Transcribing chunk")
-        texts = transcribe_audio(logger, model, audio)
-
-        transcription_result += ''.join(texts)
-
-    return transcription_result
-
-def process_audio_with_whisper_api(audio_data, whisper_model):
-    client = OpenAI(api_key=OPENAI_API_KEY)
-    
-    if len(audio_data) <= 25 * 1024 * 1024:
-        return transcribe_audio_whisper(client, audio_data, whisper_model)
-
-    logger.info('Splitting audio...')
-    audio_chunks = split_audio_into_chunks(audio_data)
-    logger.info(f'Number of chunks: {len(audio_chunks)}')
-    
-    transcriptions = transcribe_audio_chunks(client, audio_chunks, whisper_model)
-    
-    return " ".join(transcriptions)
-
-def transcribe_audio_whisper(client, audio_data, whisper_model):
-    audio_buffer = io.BytesIO(audio_data)
-    audio_buffer.name = "audio.mp3"
-    response = client.audio.transcriptions.create(
-        model=whisper_model,
-        file=audio_buffer
-    )
-    return response.text
-
-def split_audio_into_chunks(audio_data):
-    audio = AudioSegment.from_file(io.BytesIO(audio_data), format="mp3")
-    chunk_duration = 1500000
-    audio_chunks = [audio[i:i + chunk_duration] for i in range(0, len(audio), chunk_duration)]
-    return audio_chunks
-
-def transcribe_audio_chunks(client, audio_chunks, whisper_model):
-    transcriptions = []
-    for idx, chunk in enumerate(audio_chunks):
-        chunk_buffer = io.BytesIO()
-        chunk.export(chunk_buffer, format="mp3")
-        chunk_buffer.name = f"audio_chunk_{idx}.mp3"
-        chunk_buffer.seek(0)
-        response = client.audio.transcriptions.create(
-            model=whisper_model,
-            file=chunk_buffer
-        )
-        transcriptions.append(response.text)
-    return transcriptions
+        logger.info(f'Downloaded {downloaded_bytes} bytes of audio.')
+        save_video_info(folder, title, author)
+        logger.info(f'File saved as {file_path}.')
+    return file_path, title, author
+
+def plan_chunks(pcm, chunk_samples):
+    if not vad_segmentation:
+        return [[(start, min(start + chunk_samples, len(pcm)))] for start in range(0, len(pcm), chunk_samples)]
+
+    # Chunk boundaries fall in pauses and silence or music between them is never transcribed
+    flags = detect_speech(pcm, vad_mode)
+    chunks = plan_speech_chunks(flags, len(pcm), chunk_samples, vad_min_silence_ms, vad_padding_ms)
+    speech_samples = sum(end - start for spans in chunks for start, end in spans)
+    logger.info(f"VAD kept {speech_samples / SAMPLE_RATE:.1f} s of {len(pcm) / SAMPLE_RATE:.1f} s of audio in {len(chunks)} chunks")
+    return chunks
+
+def transcribe_chunks(pcm, pcm_path, chunks):
+    """
+    Return an iterator over the segments of each chunk in order, from the transcription server,
+    a process pool or a local model. A local model is loaded before this returns.
+    """
+    client = TranscriptionClient(server_url, model_name) if use_server else None
+    if client is not None and client.is_available():
+        logger.info(f"Transcribing {len(chunks)} chunks with the transcription server at {server_url}")
+        return (client.transcribe_file(pcm_path, spans) for spans in chunks)
+    if whisper_workers > 1:
+        return transcribe_chunks_parallel(logger, pcm_path, chunks, whisper_workers, model_name, device_name, whisper_backend, compute_type)
+
+    if client is not None:
+        logger.warning(f"Transcription server at {server_url} is not available, loading the model locally")
+    logger.info('loading model')
+    model = load_whisper_model(model_name, device_name, whisper_backend, compute_type)
+    return (transcribe_chunk(logger, model, pcm, spans) for spans in chunks)
+
+def process_audio(pcm, pcm_path, checkpoint_path):
+    chunks = plan_chunks(pcm, chunk_duration_ms * SAMPLE_RATE // 1000)
+
+    # Finished chunks are checkpointed, so a restarted job only transcribes what is missing
+    keys = [{'model': f"{whisper_backend}/{model_name}", 'spans': [list(span) for span in spans]} for spans in chunks]
+    done = load_checkpoint(checkpoint_path, keys)
+    missing = [idx for idx in range(len(chunks)) if idx not in done]
+    if done:
+        logger.info(f"Resuming transcription, {len(done)} of {len(chunks)} chunks already done")
+
+    segment_iterator = transcribe_chunks(pcm, pcm_path, [chunks[idx] for idx in missing])
+    start_time = time.time()
+    for idx, segments in zip(missing, segment_iterator):
+        logger.info(f"Finished chunk {idx + 1} of {len(chunks)}")
+        append_checkpoint(checkpoint_path, idx, keys[idx], segments)
+        done[idx] = segments
+
+    # Real-time factor: transcription time per second of audio transcribed in this run, below 1 is faster than real time
+    elapsed = time.time() - start_time
+    audio_seconds = sum(end - start for idx in missing for start, end in chunks[idx]) / SAMPLE_RATE
+    if audio_seconds > 0:
+        logger.info(f"Transcribed {audio_seconds:.1f} s of audio in {elapsed:.1f} s, real-time factor {elapsed / audio_seconds:.3f}")
+
+    return assemble_transcription([done[idx] for idx in range(len(chunks))])
 
 # SETUP
 
@@ -109,8 +102,31 @@ logging_level = getattr(logging, config['LOGGING']['logging_level'])
 # Set up logging
 logger = setup_logging("youtube_processing", logging_level)
 
+openai_base_url = config.get('OPENAI', 'base_url', fallback='')
+openai_timeout = config.getfloat('OPENAI', 'request_timeout', fallback=600)
+openai_connect_timeout = config.getfloat('OPENAI', 'connect_timeout', fallback=10)
+openai_max_connections = config.getint('OPENAI', 'max_connections', fallback=20)
+configure_openai(openai_base_url, openai_timeout, openai_connect_timeout, openai_max_connections)
 whisper_model = config.get('WHISPER', 'api_model_name')
+api_base_url = config.get('WHISPER', 'api_base_url', fallback='')
+api_concurrency = config.getint('WHISPER', 'api_concurrency', fallback=4)
+api_max_retries = config.getint('WHISPER', 'api_max_retries', fallback=5)
+api_bitrate_kbps = config.getint('WHISPER', 'api_bitrate_kbps', fallback=DEFAULT_BITRATE_KBPS)
+api_cache_enabled = config.getboolean('WHISPER', 'api_cache', fallback=True)
+api_cache_path = config.get('WHISPER', 'api_cache_path', fallback='data/whisper_api_cache.sqlite')
+api_cache_max_mb = config.getint('WHISPER', 'api_cache_max_mb', fallback=100)
 chunk_duration_ms = config.getint('PROCESSING', 'chunk_duration_ms')
+model_name = config.get('WHISPER', 'model_name')
+device_name = config.get('WHISPER', 'device_name')
+whisper_backend = config.get('WHISPER', 'backend', fallback=DEFAULT_BACKEND)
+compute_type = config.get('WHISPER', 'compute_type', fallback='int8')
+whisper_workers = config.getint('WHISPER', 'worker_processes', fallback=1)
+use_server = config.getboolean('WHISPER', 'use_server', fallback=False)
+server_url = config.get('WHISPER', 'server_url', fallback='http://127.0.0.1:8765')
+vad_segmentation = config.getboolean('PROCESSING', 'vad_segmentation', fallback=True)
+vad_mode = config.getint('PROCESSING', 'vad_mode', fallback=2)
+vad_min_silence_ms = config.getint('PROCESSING', 'vad_min_silence_ms', fallback=500)
+vad_padding_ms = config.getint('PROCESSING', 'vad_padding_ms', fallback=200)
 
 parser = argparse.ArgumentParser(description='Download audio from YouTube and transcribe it.')
 parser.add_argument('-c', '--url', type=str, required=True, help='URL of the YouTube video')
@@ -118,29 +134,32 @@ parser.add_argument('-a', '--api', action='store_true', help='Use API for transc
 parser.add_argument('--client', type=str, default='WEB_CREATOR', help='Client to use for YouTube download')
 
 # MAIN CODE
-args = parser.parse_args()
-
-url = args.url
-
-file_hash = hash_url(url)
-folder = file_hash
-filename = "record.mp3"
-
-audio_data, title, author = get_audio_data(url, folder, filename, client=args.client)
-
-if args.api:
-    transcription = process_audio_with_whisper_api(audio_data, whisper_model)
-    logger.debug(f"Final transcription\n{transcription}")
-    save_transcription_to_file(transcription, file_hash, url, title, author)
-else:
-    model_name = config.get('WHISPER', 'model_name')
-    device_name = config.get('WHISPER', 'device_name')
-
-    logger.info('loading model')
-    if device_name == 'gpu':
-        model = whisper.load_model(model_name)
+# Guarded so worker processes started with 'spawn' can import this module without rerunning it
+if __name__ == '__main__':
+    args = parser.parse_args()
+
+    url = args.url
+
+    file_hash = resolve_cache_folder(url)
+    folder = file_hash
+    filename = "record.mp3"
+
+    audio_path, title, author = get_audio_data(url, folder, filename, client=args.client)
+
+    # Decoded once per video to 16 kHz mono and reused by every later attempt
+    logger.info('Loading 16 kHz PCM cache')
+    pcm_path = get_data_folder(folder, PCM_FILE_NAME)
+    pcm = load_pcm(audio_path, pcm_path)
+    checkpoint_path = get_data_folder(folder, SEGMENTS_FILE_NAME)
+
+    if args.api:
+        # Chunks are as long as the 25 MB limit allows at the configured bitrate and end in pauses
+        chunks = plan_chunks(pcm, max_chunk_samples(api_bitrate_kbps))
+        whisper_client = create_whisper_client(api_base_url)
+        api_cache = DiskCache(api_cache_path, api_cache_max_mb * 1024 * 1024) if api_cache_enabled else None
+        transcription = transcribe_with_api(logger, whisper_client, pcm, chunks, whisper_model, checkpoint_path,
+                                            api_concurrency, api_max_retries, api_bitrate_kbps, api_cache)
     else:
-        model = whisper.load_model(model_name, device=device_name)
-    transcription = process_audio(audio_data)
+        transcription = process_audio(pcm, pcm_path, checkpoint_path)
     logger.debug(f"Final transcription\n{transcription}")
     save_transcription_to_file(transcription, file_hash, url, title, author)
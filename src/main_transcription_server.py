@@ -0,0 +1,100 @@
+import configparser
+import json
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+import numpy as np
+
+from audio.transcribe_audio import DEFAULT_BACKEND, load_whisper_model, transcribe_segments
+from audio.whisper_pool import transcribe_chunk
+from utils.logging_setup import setup_logging
+
+# Long-lived local transcription service. Models are loaded once at startup and shared by
+# main_transcribe_yt.py and main_audio_transcription_live.py through audio.transcription_client.
+
+class TranscriptionHandler(BaseHTTPRequestHandler):
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if urlparse(self.path).path == "/health":
+            self._send_json(200, {'models': list(models)})
+        else:
+            self._send_json(404, {'error': 'Not found'})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != "/transcribe":
+            self._send_json(404, {'error': 'Not found'})
+            return
+
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        try:
+            if self.headers.get('Content-Type') == "application/json":
+                request = json.loads(body)
+                model_name = request.get('model', default_model)
+                spans = [tuple(span) for span in request['spans']]
+                pcm = np.memmap(request['path'], dtype=np.int16, mode='r')
+            else:
+                model_name = parse_qs(url.query).get('model', [default_model])[0]
+                audio = np.frombuffer(body, dtype='<f4')
+        except (KeyError, TypeError, ValueError, OSError) as e:
+            self._send_json(400, {'error': str(e)})
+            return
+
+        if model_name not in models:
+            self._send_json(404, {'error': f"Model '{model_name}' is not loaded"})
+            return
+
+        # A Whisper model is not safe to use from two threads at once
+        try:
+            with model_locks[model_name]:
+                if self.headers.get('Content-Type') == "application/json":
+                    segments = transcribe_chunk(logger, models[model_name], pcm, spans)
+                else:
+                    segments = transcribe_segments(logger, models[model_name], audio)
+        except Exception as e:
+            logger.error(f"Transcription failed: {e}")
+            self._send_json(500, {'error': str(e)})
+            return
+        self._send_json(200, {'segments': segments})
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+### MAIN ###
+
+config = configparser.ConfigParser()
+config.read('config.ini')
+
+logging_level = getattr(logging, config['LOGGING']['logging_level'])
+logger = setup_logging("transcription_server", logging_level)
+
+default_model = config.get('WHISPER', 'model_name')
+device_name = config.get('WHISPER', 'device_name')
+whisper_backend = config.get('WHISPER', 'backend', fallback=DEFAULT_BACKEND)
+compute_type = config.get('WHISPER', 'compute_type', fallback='int8')
+model_names = [name.strip() for name in config.get('WHISPER', 'server_models', fallback=default_model).split(',') if name.strip()]
+server_url = urlparse(config.get('WHISPER', 'server_url', fallback='http://127.0.0.1:8765'))
+
+models = {}
+model_locks = {}
+for name in model_names:
+    logger.info(f"loading model {name}")
+    models[name] = load_whisper_model(name, device_name, whisper_backend, compute_type)
+    model_locks[name] = threading.Lock()
+
+server = ThreadingHTTPServer((server_url.hostname, server_url.port), TranscriptionHandler)
+logger.info(f"Transcription server listening on {server_url.geturl()} with models: {', '.join(models)}")
+try:
+    server.serve_forever()
+except KeyboardInterrupt:
+    pass
+finally:
+    server.server_close()
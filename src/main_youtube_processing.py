@@ -4,41 +4,110 @@ import configparser
 import json
 import logging
 import os
+import time
+from datetime import datetime, timezone
 from pathlib import Path
 from urllib.parse import urlparse
 
-from airtable import Airtable
-
+from audio.audio_manager import download_audio_to_file, expand_collection_url, is_video_error
 from keys import AIRTABLE_API_KEY, AIRTABLE_BASE_ID
-from utils.utils import get_data_folder, hash_url, read_transcription_file
-from utils.airtable_manager import ensure_table_exists
+from utils.utils import (
+    get_data_folder,
+    get_video_id,
+    is_collection_url,
+    migrate_legacy_folders,
+    read_transcription_file,
+    resolve_cache_folder,
+    save_video_info
+)
+from utils.airtable_manager import BATCH_SIZE, AirtableClient, AirtableError, ensure_table_exists
+from utils.client_stats import open_client_stats, rank_clients, record_client_result
+from utils.job_store import (
+    DONE_STAGE,
+    STAGES,
+    WAITING_STAGE,
+    add_job,
+    child_jobs,
+    dead_letter_airtable_changes,
+    fail_job,
+    fail_stage,
+    finish_stage,
+    get_job,
+    get_setting,
+    has_pending_airtable_changes,
+    open_job_store,
+    pending_airtable_changes,
+    queue_airtable_insert,
+    queue_airtable_update,
+    remove_airtable_changes,
+    requeue_job,
+    resumable_jobs,
+    retry_stage,
+    set_attempts,
+    set_job_stage,
+    set_setting,
+    stage_timings,
+    start_stage,
+    waiting_jobs
+)
 from utils.logging_setup import setup_logging
 
+class StageRetry(Exception):
+    """Raised by a stage handler whose job should run the same stage again."""
+
 async def fetch_unprocessed_urls():
-    records = airtable_url_inputs.get_all(filterByFormula="NOT({Processed})")
-    return [(record['id'], record['fields']['Url']) for record in records if 'Url' in record['fields']]
+    """Fetch unprocessed inputs changed since the previous poll, with a periodic full scan as a safety net."""
+    poll_started = time.time()
+    high_water_mark = get_setting(job_store, 'inputs_high_water_mark')
+    last_full_scan = float(get_setting(job_store, 'inputs_last_full_scan', 0))
+
+    formula = "NOT({Processed})"
+    full_scan = high_water_mark is None or poll_started - last_full_scan >= full_scan_interval
+    if not full_scan:
+        # The overlap covers clock skew between this machine and Airtable
+        since = datetime.fromtimestamp(float(high_water_mark) - poll_overlap, timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+        formula = f"AND(NOT({{Processed}}), IS_AFTER(LAST_MODIFIED_TIME(), DATETIME_PARSE('{since}')))"
+
+    records = await airtable.list_records(URL_INPUTS_TABLE, formula=formula, fields=['Url', 'Retries'])
+    set_setting(job_store, 'inputs_high_water_mark', poll_started)
+    if full_scan:
+        set_setting(job_store, 'inputs_last_full_scan', poll_started)
+    return [(record['id'], record['fields']['Url'], record['fields'].get('Retries', 0))
+            for record in records if 'Url' in record['fields']]
+
+def get_input_record_id(record_id):
+    """Url Inputs row a job belongs to: its own row, or the playlist/channel row it was expanded from."""
+    job = get_job(job_store, record_id)
+    return job['parent_record_id'] or record_id
+
+def update_input_row(record_id, fields):
+    # Video jobs expanded from a playlist have no row of their own
+    job = get_job(job_store, record_id)
+    if job['parent_record_id'] is None:
+        queue_airtable_update(job_store, URL_INPUTS_TABLE, record_id, fields)
 
 async def mark_url_as_processed(record_id):
-    airtable_url_inputs.update(record_id, {"Processed": True})
+    update_input_row(record_id, {"Processed": True})
 
-async def save_summary_to_airtable(summary_json, url, title, author, hash):
+async def save_summary_to_airtable(summary_json, url, title, author, hash, input_record_id):
     summary_data = json.loads(summary_json)  # Converts JSON string to dictionary
     summary_data = {key.capitalize(): value for key, value in summary_data.items()}
     summary_data['Title'] = title
     summary_data['Author'] = author
     summary_data['Url'] = url
     summary_data['Hash'] = hash
+    # Without schema write access the link field may be missing, and Airtable would reject the whole row
+    if 'Input' in summary_table_fields:
+        summary_data['Input'] = [input_record_id]
 
-    airtable_youtube_summaries.insert(summary_data)
-
-async def create_transcription(url, record_id):
+    queue_airtable_insert(job_store, YOUTUBE_SUMMARIES_TABLE, summary_data)
 
-    transcription_file_name = "transcription.txt"
-
-    file_path = get_data_folder(hash_url(url), transcription_file_name)
-    if os.path.exists(file_path):
-        logger.info(f"Trancription file {file_path} already exists...")
-        return file_path, hash_url(url)
+async def download_audio(url, record_id):
+    folder = resolve_cache_folder(url)
+    if os.path.exists(get_data_folder(folder, transcription_file_name)) or \
+            os.path.exists(get_data_folder(folder, audio_file_name)):
+        logger.info(f"Audio for {url} already downloaded...")
+        return True
 
     clients = [
         'WEB_EMBED', 'WEB_CREATOR', 'WEB_MUSIC', 'WEB_SAFARI',
@@ -46,43 +115,73 @@ async def create_transcription(url, record_id):
         'IOS', 'IOS_MUSIC', 'IOS_CREATOR',
         'MWEB', 'TV_EMBED', 'MEDIA_CONNECT'
     ]
-    max_retries = 5
-    retries = 0
-
-    # Get current retry count from Airtable
-    record = airtable_url_inputs.get(record_id)
-    if 'Retries' in record['fields']:
-        retries = record['fields']['Retries']
+    retries = get_job(job_store, record_id)['attempts']
 
+    # Clients are ordered by their observed success rate and speed, not tried in a fixed order
+    ranked_clients = iter(rank_clients(job_store, clients))
     while retries < max_retries:
-        client = clients[retries % len(clients)]
+        client = next(ranked_clients)
         logger.info(f"Attempt {retries + 1} with client {client}")
 
-        use_api = config.getboolean('WHISPER', 'use_api')
-        command = ['python', 'main_transcribe_yt.py', '-c', url, '--client', client]
-        if use_api:
-            command.append('-a')
+        start_time = time.time()
+        try:
+            downloaded_bytes, title, author = await asyncio.to_thread(
+                download_audio_to_file, url, get_data_folder(folder, audio_file_name), client,
+                download_connections, parallel_download_min_mb * 1024 * 1024)
+        except Exception as e:
+            if is_video_error(e):
+                # Another client would meet the same dead video, and it says nothing about this one
+                logger.error(f"Video {url} cannot be downloaded: {str(e)}")
+                raise
+            logger.warning(f"Client {client} failed to download {url}: {str(e)}")
+            record_client_result(job_store, client, False)
+        else:
+            download_time = time.time() - start_time
+            logger.info(f"Downloaded {downloaded_bytes} bytes with client {client} in {download_time:.1f}s")
+            record_client_result(job_store, client, True, downloaded_bytes, download_time)
+            save_video_info(folder, title, author)
+            return True
 
-        process = await asyncio.create_subprocess_exec(
-            *command,
-            stdout=None, stderr=None
-        )
-        await process.communicate()
+        retries += 1
+        set_attempts(job_store, record_id, retries)
+        update_input_row(record_id, {"Retries": retries})
 
-        file_path = get_data_folder(hash_url(url), transcription_file_name)
-        if os.path.exists(file_path):
-            return file_path, hash_url(url)
+    logger.error(f"Failed to download {url} after {max_retries} attempts")
+    raise RuntimeError("Too many attempts")
 
-        retries += 1
-        airtable_url_inputs.update(record_id, {"Retries": retries})
+async def create_transcription(url, record_id):
+    folder = resolve_cache_folder(url)
+    file_path = get_data_folder(folder, transcription_file_name)
+    if os.path.exists(file_path):
+        logger.info(f"Trancription file {file_path} already exists...")
+        return file_path, folder
+
+    command = ['python', 'main_transcribe_yt.py', '-c', url]
+    if config.getboolean('WHISPER', 'use_api'):
+        command.append('-a')
+
+    process = await asyncio.create_subprocess_exec(
+        *command,
+        stdout=None, stderr=None
+    )
+    await process.communicate()
+
+    if os.path.exists(file_path):
+        return file_path, folder
+
+    # Failed transcriptions use up the same attempts as failed downloads
+    retries = get_job(job_store, record_id)['attempts'] + 1
+    set_attempts(job_store, record_id, retries)
+    update_input_row(record_id, {"Retries": retries})
+    if retries < max_retries:
+        raise StageRetry(f"Transcription attempt {retries} failed")
 
     logger.error(f"Failed to transcribe {url} after {max_retries} attempts")
-    airtable_url_inputs.update(record_id, {"Processed": True, "Error": "Too many attempts"})
-    return None, None
+    raise RuntimeError("Too many attempts")
 
 async def summarize_transcription(file_path):
-    json_file_path = Path(file_path).with_name('summary.json')
-    
+    json_file_path = Path(file_path).with_name(summary_file_name)
+
     process = await asyncio.create_subprocess_exec(
         'python', 'main_gpt_summary.py', '-f', file_path,
         stdout=None, stderr=None
@@ -95,23 +194,292 @@ async def summarize_transcription(file_path):
 
     return summary
 
-async def process_url(record_id, url):
-    try:
-        file_path, hash = await create_transcription(url, record_id)
-        if not file_path:
-            return
-        url, title, author, _ = read_transcription_file(file_path)
+# PIPELINE
+# Stage handlers raise on failure; the job store records where each job is,
+# so a restarted process picks every job up at the stage it was in.
+
+async def expand_stage(job):
+    """Turn a playlist or channel job into one job per video; single videos pass straight through."""
+    if not is_collection_url(job['url']):
+        return True
+
+    video_urls = await asyncio.to_thread(expand_collection_url, job['url'])
+    logger.info(f"Expanded {job['url']} into {len(video_urls)} videos")
+
+    video_jobs = []
+    for video_url in video_urls:
+        folder = resolve_cache_folder(video_url)
+        if os.path.exists(get_data_folder(folder, summary_file_name)):
+            logger.info(f"Skipping {video_url}, already summarized")
+            continue
 
-        summary_json = await summarize_transcription(file_path)
-        await save_summary_to_airtable(summary_json, url, title, author, hash)
-        await mark_url_as_processed(record_id)
+        record_id = f"{job['record_id']}/{get_video_id(video_url) or folder}"
+        video_job = get_job(job_store, record_id)
+        if video_job is None:
+            add_job(job_store, record_id, video_url, parent_record_id=job['record_id'], stage=STAGES[1])
+        elif video_job['stage'] == DONE_STAGE or video_job['status'] == 'failed':
+            requeue_job(job_store, record_id, video_url, stage=STAGES[1])
+        elif record_id in in_progress:
+            continue
+        video_jobs.append({'record_id': record_id, 'url': video_url})
+
+    # Mark the collection as waiting before its videos can finish and check on it
+    set_job_stage(job_store, job['record_id'], WAITING_STAGE)
+    if not video_jobs:
+        check_collection_finished(job['record_id'])
+    for video_job in video_jobs:
+        in_progress.add(video_job['record_id'])
+        await pipeline_queues[STAGES[1]].put(video_job)
+    return False
+
+def finish_collection_job(record_id):
+    videos = child_jobs(job_store, record_id)
+    failed = [video for video in videos if video['status'] == 'failed']
+    fields = {"Processed": True}
+    if failed:
+        fields["Error"] = f"{len(failed)} of {len(videos)} videos failed"
+    set_job_stage(job_store, record_id, DONE_STAGE)
+    queue_airtable_update(job_store, URL_INPUTS_TABLE, record_id, fields)
+    logger.info(f"Finished collection {record_id}: {len(videos) - len(failed)} of {len(videos)} videos processed")
+
+def check_collection_finished(parent_record_id):
+    parent = get_job(job_store, parent_record_id)
+    if parent is None or parent['stage'] != WAITING_STAGE:
+        return
+    videos = child_jobs(job_store, parent_record_id)
+    if all(video['stage'] == DONE_STAGE or video['status'] == 'failed' for video in videos):
+        finish_collection_job(parent_record_id)
+
+async def download_stage(job):
+    await download_audio(job['url'], job['record_id'])
+
+async def transcribe_stage(job):
+    await create_transcription(job['url'], job['record_id'])
+
+async def summarize_stage(job):
+    folder = resolve_cache_folder(job['url'])
+    file_path = get_data_folder(folder, transcription_file_name)
+    url, title, author, _ = read_transcription_file(file_path)
+
+    summary_json = await summarize_transcription(file_path)
+    await save_summary_to_airtable(summary_json, url, title, author, folder, get_input_record_id(job['record_id']))
+    await mark_url_as_processed(job['record_id'])
+
+def get_folder_lock(folder):
+    if folder not in folder_locks:
+        folder_locks[folder] = asyncio.Lock()
+    return folder_locks[folder]
+
+def finish_job(job):
+    if 'lock' in job:
+        job['lock'].release()
+    in_progress.discard(job['record_id'])
+
+    parent_record_id = get_job(job_store, job['record_id'])['parent_record_id']
+    if parent_record_id is not None:
+        check_collection_finished(parent_record_id)
+
+async def put_back_later(queue, job):
+    await asyncio.sleep(retry_delay)
+    await queue.put(job)
+    # Only now, so joining the queue still waits for the job
+    queue.task_done()
+
+def retry_later(queue, job):
+    """Put a job back at the end of the queue it was taken from, without holding up the worker."""
+    task = asyncio.create_task(put_back_later(queue, job))
+    retry_tasks.add(task)
+    task.add_done_callback(retry_tasks.discard)
+
+async def stage_worker(stage_name, handler, in_queue, out_queue, next_stage):
+    while True:
+        job = await in_queue.get()
+        passed_on = False
+        retried = False
+        try:
+            # Jobs for URLs sharing a data folder must not run at the same time,
+            # the lock is held until the job leaves the pipeline
+            if 'lock' not in job:
+                lock = get_folder_lock(resolve_cache_folder(job['url']))
+                if lock.locked():
+                    # The job holding the folder may be queued behind this worker,
+                    # so wait at the back of the queue instead of blocking the worker
+                    retry_later(in_queue, job)
+                    retried = True
+                    continue
+                await lock.acquire()
+                job['lock'] = lock
+
+            run_id = start_stage(job_store, job['record_id'], stage_name)
+            try:
+                passes_on = await handler(job) is not False
+            except StageRetry as e:
+                logger.warning(f"Retrying {stage_name} of {job['url']}: {str(e)}")
+                retry_stage(job_store, run_id, job['record_id'], str(e))
+                retry_later(in_queue, job)
+                retried = True
+                continue
+            except Exception as e:
+                logger.error(f"Failed to {stage_name} {job['url']}: {str(e)}")
+                fail_stage(job_store, run_id, job['record_id'], str(e))
+                update_input_row(job['record_id'], {"Processed": True, "Error": str(e)})
+                continue
+
+            if not passes_on:
+                # The handler has already moved the job to where it belongs
+                finish_stage(job_store, run_id, job['record_id'], get_job(job_store, job['record_id'])['stage'])
+                continue
+
+            finish_stage(job_store, run_id, job['record_id'], next_stage)
+            if out_queue is not None:
+                # Waits while the next stage is saturated, which throttles this one
+                await out_queue.put(job)
+                passed_on = True
+            else:
+                timings = ", ".join(f"{stage} {seconds:.1f}s" for stage, _, seconds in stage_timings(job_store, job['record_id']))
+                logger.info(f"Processed {job['url']} ({timings})")
+        finally:
+            if not passed_on and not retried:
+                finish_job(job)
+            if not retried:
+                in_queue.task_done()
+
+def start_pipeline():
+    handlers = {
+        'expand': (expand_stage, 1),
+        'download': (download_stage, download_workers),
+        'transcribe': (transcribe_stage, transcribe_workers),
+        'summarize': (summarize_stage, summarize_workers),
+    }
+    queues = pipeline_queues
+    for stage_name in STAGES:
+        queues[stage_name] = asyncio.Queue(maxsize=stage_queue_size)
+    workers = []
+    for idx, stage_name in enumerate(STAGES):
+        handler, worker_count = handlers[stage_name]
+        next_stage = STAGES[idx + 1] if idx + 1 < len(STAGES) else DONE_STAGE
+        out_queue = queues.get(next_stage)
+        for _ in range(worker_count):
+            workers.append(asyncio.create_task(stage_worker(stage_name, handler, queues[stage_name], out_queue, next_stage)))
+        logger.info(f"Started {worker_count} {stage_name} workers")
+    return queues, workers
+
+async def resume_jobs(queues):
+    for job in resumable_jobs(job_store):
+        logger.info(f"Resuming {job['url']} at stage {job['stage']}")
+        in_progress.add(job['record_id'])
+        await queues[job['stage']].put({'record_id': job['record_id'], 'url': job['url']})
+    # Collections whose last video finished just before the process stopped
+    for job in waiting_jobs(job_store):
+        check_collection_finished(job['record_id'])
+
+async def enqueue_new_jobs(queues):
+    """Queue new and reset input records, returning how many were queued."""
+    new_jobs = 0
+    urls = await fetch_unprocessed_urls()
+    for record_id, url, retries in urls:
+        # Records still being processed show up again as unprocessed
+        if record_id in in_progress:
+            continue
 
-    except Exception as e:
-        logger.error(f"Failed to process {url}: {str(e)}")
-        airtable_url_inputs.update(record_id, {"Processed": True, "Error": str(e)})
+        job = get_job(job_store, record_id)
+        if job is not None:
+            # Finished jobs stay unprocessed in Airtable until the outbox is synced,
+            # after that an unprocessed record means it was reset for another run
+            if job['status'] != 'failed' and job['stage'] != DONE_STAGE or \
+                    has_pending_airtable_changes(job_store, record_id):
+                continue
+            requeue_job(job_store, record_id, url)
+        else:
+            add_job(job_store, record_id, url, attempts=retries)
+
+        new_jobs += 1
+        parsed_url = urlparse(url)
+        if parsed_url.scheme and parsed_url.netloc:
+            in_progress.add(record_id)
+            await queues[STAGES[0]].put({'record_id': record_id, 'url': url})
+        else:
+            logger.warning(f"Invalid URL: {url}")
+            fail_job(job_store, record_id, "Invalid URL")
+            update_input_row(record_id, {"Processed": True, "Error": "Invalid URL"})
+    return new_jobs
+
+def batch_airtable_changes(changes):
+    """Group consecutive outbox changes of the same table and kind into batch calls of at most BATCH_SIZE records.
+
+    Repeated updates of one record within a batch are merged, later fields winning. Batches keep the
+    outbox order, so a summary is still inserted before its input row is marked as processed.
+    """
+    batches = []
+    for change_id, table_name, record_id, fields in changes:
+        kind = 'insert' if record_id is None else 'update'
+        batch = batches[-1] if batches else None
+        if batch is None or batch['table'] != table_name or batch['kind'] != kind or \
+                (len(batch['records']) >= BATCH_SIZE and record_id not in batch['records']):
+            batch = {'table': table_name, 'kind': kind, 'change_ids': [], 'records': {}, 'record_change_ids': {}}
+            batches.append(batch)
+        batch['change_ids'].append(change_id)
+        key = change_id if record_id is None else record_id
+        batch['records'][key] = {**batch['records'].get(key, {}), **fields}
+        batch['record_change_ids'].setdefault(key, []).append(change_id)
+    return batches
+
+async def send_airtable_batch(batch, keys):
+    records = {key: batch['records'][key] for key in keys}
+    if batch['kind'] == 'insert':
+        await airtable.insert_records(batch['table'], list(records.values()))
+    else:
+        await airtable.update_records(batch['table'], list(records.items()))
+
+def is_rejected(error):
+    return isinstance(error, AirtableError) and error.is_permanent()
+
+async def sync_records_separately(batch):
+    """Send a rejected batch record by record, moving the records Airtable still rejects to the dead letter table."""
+    for key, change_ids in batch['record_change_ids'].items():
+        try:
+            await send_airtable_batch(batch, [key])
+        except Exception as e:
+            if not is_rejected(e):
+                logger.error(f"Failed to sync {len(change_ids)} changes to Airtable: {str(e)}")
+                return False
+            logger.error(f"Airtable rejected a change to {batch['table']}, moved it to the dead letter table: {str(e)}")
+            dead_letter_airtable_changes(job_store, change_ids, str(e))
+        else:
+            remove_airtable_changes(job_store, change_ids)
+    return True
+
+async def sync_airtable_changes():
+    """Push queued changes to Airtable in the order they were made, stopping at the first failure that may pass.
+
+    Changes Airtable rejects for good (a 4xx other than 429) are set aside, so they do not hold up the rest.
+    """
+    async with airtable_sync_lock:
+        while True:
+            changes = pending_airtable_changes(job_store)
+            if not changes:
+                return
+            for batch in batch_airtable_changes(changes):
+                try:
+                    await send_airtable_batch(batch, list(batch['records']))
+                except Exception as e:
+                    if not is_rejected(e):
+                        logger.error(f"Failed to sync {len(batch['change_ids'])} changes to Airtable: {str(e)}")
+                        return
+                    # Airtable rejects the whole batch for one bad record
+                    if not await sync_records_separately(batch):
+                        return
+                    continue
+                remove_airtable_changes(job_store, batch['change_ids'])
+
+async def airtable_sync_loop():
+    while True:
+        await sync_airtable_changes()
+        await asyncio.sleep(airtable_sync_interval)
 
 async def create_tables():
-    await ensure_table_exists(URL_INPUTS_TABLE, [
+    global summary_table_fields
+    inputs_table_id, _ = await ensure_table_exists(airtable, URL_INPUTS_TABLE, [
         {"name": "Url", "type": "singleLineText"},
         {
             "name": "Processed",
@@ -131,39 +499,56 @@ async def create_tables():
         }
     ])
 
-    await ensure_table_exists(YOUTUBE_SUMMARIES_TABLE, [
+    _, summary_table_fields = await ensure_table_exists(airtable, YOUTUBE_SUMMARIES_TABLE, [
         {"name": "Title", "type": "singleLineText"},
         {"name": "Author", "type": "singleLineText"},
         {"name": "Description", "type": "multilineText"},
         {"name": "Summary", "type": "multilineText"},
         {"name": "Url", "type": "singleLineText"},
         {"name": "Category", "type": "singleLineText"},
-        {"name": "Hash", "type": "singleLineText"}
+        {"name": "Hash", "type": "singleLineText"},
+        {
+            "name": "Input",
+            "type": "multipleRecordLinks",
+            "options": {
+                "linkedTableId": inputs_table_id
+            }
+        }
     ])
+    if 'Input' not in summary_table_fields:
+        logger.warning(f"Table '{YOUTUBE_SUMMARIES_TABLE}' has no Input field, summaries will not be linked to their input rows")
 
 async def process_loop():
     await create_tables()
 
-    while True:
-        urls = await fetch_unprocessed_urls()
-        if not urls:
-            await asyncio.sleep(sleep_time)
-            continue
+    migrated = migrate_legacy_folders()
+    if migrated:
+        logger.info(f"Moved {migrated} cached folders to video id names")
 
-        for record_id, url in urls:
-            parsed_url = urlparse(url)
-            if parsed_url.scheme and parsed_url.netloc:
-                await process_url(record_id, url)
-            else:
-                logger.warning(f"Invalid URL: {url}")
-                airtable_url_inputs.update(record_id, {"Processed": True, "Error": "Invalid URL"})
+    queues, workers = start_pipeline()
+    sync_task = asyncio.create_task(airtable_sync_loop())
+    await resume_jobs(queues)
+
+    poll_interval = sleep_time
+    while True:
+        new_jobs = await enqueue_new_jobs(queues)
 
         if args.once:
+            # Stages pass a job on before marking it done, so joining in order drains the pipeline
+            for stage_name in STAGES:
+                await queues[stage_name].join()
+            for worker in workers:
+                worker.cancel()
+            await sync_airtable_changes()
+            sync_task.cancel()
+            await airtable.close()
             if args.shutdown:
                 os.system("shutdown /s /t 1")
             break
 
-        await asyncio.sleep(sleep_time) 
+        # Back off while the table is idle, poll at the base rate again as soon as something arrives
+        poll_interval = sleep_time if new_jobs else min(poll_interval * 2, max_sleep_time)
+        await asyncio.sleep(poll_interval)
 
 config = configparser.ConfigParser()
 config.read('config.ini')
@@ -172,6 +557,38 @@ URL_INPUTS_TABLE = config.get('AIRTABLE', 'inputs_table_name')
 YOUTUBE_SUMMARIES_TABLE = config.get('AIRTABLE', 'summaries_table_name')
 
 sleep_time = config.getint('PROCESSING', 'sleep_time')
+max_sleep_time = config.getint('PROCESSING', 'max_sleep_time', fallback=sleep_time)
+full_scan_interval = config.getint('AIRTABLE', 'full_scan_interval', fallback=3600)
+poll_overlap = config.getint('AIRTABLE', 'poll_overlap', fallback=60)
+download_workers = config.getint('PROCESSING', 'download_workers', fallback=1)
+transcribe_workers = config.getint('PROCESSING', 'transcribe_workers', fallback=1)
+summarize_workers = config.getint('PROCESSING', 'summarize_workers', fallback=1)
+stage_queue_size = config.getint('PROCESSING', 'stage_queue_size', fallback=2)
+job_store_path = config.get('PROCESSING', 'job_store_path', fallback='data/jobs.sqlite')
+download_connections = config.getint('PROCESSING', 'download_connections', fallback=1)
+parallel_download_min_mb = config.getint('PROCESSING', 'parallel_download_min_mb', fallback=64)
+airtable_sync_interval = config.getint('AIRTABLE', 'sync_interval', fallback=5)
+
+transcription_file_name = "transcription.txt"
+summary_file_name = "summary.json"
+audio_file_name = "record.mp3"
+# Download and transcription attempts per job, counted in the Retries field
+max_retries = 5
+# Seconds before a job is put back on the queue it has to run again from
+retry_delay = 5
+
+# Record ids currently in the pipeline, locks guarding data/<hash>/ folders, the stage queues
+# and the jobs waiting to be put back on them
+in_progress = set()
+folder_locks = {}
+pipeline_queues = {}
+retry_tasks = set()
+# Fields of the summaries table, known once create_tables has run
+summary_table_fields = set()
+
+job_store = open_job_store(job_store_path)
+open_client_stats(job_store)
+airtable_sync_lock = asyncio.Lock()
 
 # Command line arguments
 parser = argparse.ArgumentParser(description='Process YouTube URLs from Airtable.')
@@ -180,9 +597,12 @@ parser.add_argument('--shutdown', action='store_true', default=False, help='Shut
 
 args = parser.parse_args()
 
-# Airtable instance
-airtable_url_inputs = Airtable(AIRTABLE_BASE_ID, URL_INPUTS_TABLE, AIRTABLE_API_KEY)
-airtable_youtube_summaries = Airtable(AIRTABLE_BASE_ID, YOUTUBE_SUMMARIES_TABLE, AIRTABLE_API_KEY)
+# Airtable client shared by polling, table setup and outbox sync
+airtable = AirtableClient(
+    AIRTABLE_API_KEY, AIRTABLE_BASE_ID,
+    api_url=config.get('AIRTABLE', 'api_url', fallback='https://api.airtable.com'),
+    rate_limit=config.getfloat('AIRTABLE', 'requests_per_second', fallback=5)
+)
 
 # Accessing the settings
 logging_level = getattr(logging, config['LOGGING']['logging_level'])
@@ -1,25 +1,154 @@
-from aiohttp import ClientSession
-
-from keys import AIRTABLE_API_KEY, AIRTABLE_BASE_ID
-
-async def ensure_table_exists(table_name, fields):
-    """Ensure that a table exists in Airtable; if not, create it."""
-    async with ClientSession() as session:
-        url = f"https://api.airtable.com/v0/meta/bases/{AIRTABLE_BASE_ID}/tables"
-        headers = {
-            "Authorization": f"Bearer {AIRTABLE_API_KEY}",
-            "Content-Type": "application/json"
-        }
-        async with session.get(url, headers=headers) as response:
-            existing_tables = await response.json()
-            table_names = [table['name'] for table in existing_tables['tables']]
-        
-        if table_name not in table_names:
-            async with session.post(url, headers=headers, json={
+import asyncio
+import time
+from urllib.parse import quote
+
+from aiohttp import ClientSession, ClientTimeout
+
+# Airtable accepts at most 10 records per create/update call and 5 requests per second per base
+BATCH_SIZE = 10
+RATE_LIMIT = 5
+# Airtable asks clients to wait 30 seconds after a 429 response
+RATE_LIMITED_WAIT = 30
+
+class AirtableError(RuntimeError):
+    """An error response from Airtable, with its HTTP status."""
+
+    def __init__(self, message, status):
+        super().__init__(message)
+        self.status = status
+
+    def is_permanent(self):
+        # Sending the same request again cannot fix a client error other than rate limiting
+        return 400 <= self.status < 500 and self.status != 429
+
+class TokenBucket:
+    """Async token bucket refilled at `rate` tokens per second, holding at most `capacity` tokens."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+class AirtableClient:
+    """Async Airtable REST client sharing one aiohttp session and one rate limiter for the whole base."""
+
+    def __init__(self, api_key, base_id, api_url="https://api.airtable.com", rate_limit=RATE_LIMIT, max_retries=5):
+        self.api_key = api_key
+        self.base_id = base_id
+        self.api_url = api_url.rstrip('/')
+        self.bucket = TokenBucket(rate_limit)
+        self.max_retries = max_retries
+        self.session = None
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    def _get_session(self):
+        # Created lazily so the session belongs to the running event loop
+        if self.session is None:
+            self.session = ClientSession(
+                timeout=ClientTimeout(total=60),
+                headers={
+                    "Authorization": f"Bearer {self.api_key}",
+                    "Content-Type": "application/json"
+                }
+            )
+        return self.session
+
+    def table_url(self, table_name):
+        return f"{self.api_url}/v0/{self.base_id}/{quote(table_name, safe='')}"
+
+    def meta_url(self):
+        return f"{self.api_url}/v0/meta/bases/{self.base_id}/tables"
+
+    async def request(self, method, url, **kwargs):
+        session = self._get_session()
+        for attempt in range(self.max_retries + 1):
+            await self.bucket.acquire()
+            async with session.request(method, url, **kwargs) as response:
+                if response.status == 429:
+                    await asyncio.sleep(RATE_LIMITED_WAIT)
+                    continue
+                if response.status >= 500 and attempt < self.max_retries:
+                    await asyncio.sleep(2 ** attempt)
+                    continue
+                if response.status >= 400:
+                    raise AirtableError(f"Airtable {method} {url} returned {response.status}: {await response.text()}", response.status)
+                return await response.json()
+        raise RuntimeError(f"Airtable {method} {url} failed after {self.max_retries + 1} attempts")
+
+    async def list_records(self, table_name, formula=None, fields=None):
+        params = []
+        if formula:
+            params.append(("filterByFormula", formula))
+        for field in fields or []:
+            params.append(("fields[]", field))
+
+        records = []
+        offset = None
+        while True:
+            page_params = params + ([("offset", offset)] if offset else [])
+            page = await self.request("GET", self.table_url(table_name), params=page_params)
+            records.extend(page.get("records", []))
+            offset = page.get("offset")
+            if not offset:
+                return records
+
+    async def update_records(self, table_name, updates):
+        """Update (record_id, fields) pairs using as few batch calls as possible."""
+        records = [{"id": record_id, "fields": fields} for record_id, fields in updates]
+        for i in range(0, len(records), BATCH_SIZE):
+            await self.request("PATCH", self.table_url(table_name), json={"records": records[i:i + BATCH_SIZE]})
+
+    async def insert_records(self, table_name, rows):
+        records = [{"fields": fields} for fields in rows]
+        for i in range(0, len(records), BATCH_SIZE):
+            await self.request("POST", self.table_url(table_name), json={"records": records[i:i + BATCH_SIZE]})
+
+async def ensure_table_exists(client, table_name, fields):
+    """Ensure that a table with the given fields exists in Airtable, creating whatever is missing.
+
+    Returns the table id (None if the table could not be created) and the names of the fields the table has.
+    """
+    existing_tables = await client.request("GET", client.meta_url())
+    tables = {table['name']: table for table in existing_tables['tables']}
+
+    if table_name not in tables:
+        try:
+            created_table = await client.request("POST", client.meta_url(), json={
                 "name": table_name,
                 "fields": fields
-            }) as response:
-                if response.status == 200:
-                    print(f"Table '{table_name}' created successfully.")
-                else:
-                    print(f"Failed to create table '{table_name}': {await response.text()}")
\ No newline at end of file
+            })
+            print(f"Table '{table_name}' created successfully.")
+            return created_table['id'], {field['name'] for field in fields}
+        except RuntimeError as e:
+            print(f"Failed to create table '{table_name}': {e}")
+            return None, set()
+
+    table = tables[table_name]
+    existing_fields = {field['name'] for field in table.get('fields', [])}
+    for field in fields:
+        if field['name'] in existing_fields:
+            continue
+        try:
+            await client.request("POST", f"{client.meta_url()}/{table['id']}/fields", json=field)
+            existing_fields.add(field['name'])
+            print(f"Field '{field['name']}' added to table '{table_name}'.")
+        except RuntimeError as e:
+            print(f"Failed to add field '{field['name']}' to table '{table_name}': {e}")
+    return table['id'], existing_fields
@@ -0,0 +1,64 @@
+import random
+import time
+
+# Scoreboard of YouTube download clients, kept in the job store database.
+# Older observations decay with HALF_LIFE so a client that recovers gets picked again.
+
+HALF_LIFE = 6 * 3600
+
+def open_client_stats(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS client_stats (
+            client TEXT PRIMARY KEY,
+            successes REAL NOT NULL DEFAULT 0,
+            failures REAL NOT NULL DEFAULT 0,
+            bytes REAL NOT NULL DEFAULT 0,
+            seconds REAL NOT NULL DEFAULT 0,
+            updated_at REAL NOT NULL
+        )
+    """)
+    conn.commit()
+
+def _decayed_stats(row, now):
+    factor = 0.5 ** ((now - row['updated_at']) / HALF_LIFE)
+    return {key: row[key] * factor for key in ('successes', 'failures', 'bytes', 'seconds')}
+
+def get_client_stats(conn):
+    now = time.time()
+    return {row['client']: _decayed_stats(row, now) for row in conn.execute("SELECT * FROM client_stats")}
+
+def record_client_result(conn, client, success, downloaded_bytes=0, seconds=0):
+    now = time.time()
+    row = conn.execute("SELECT * FROM client_stats WHERE client = ?", (client,)).fetchone()
+    stats = _decayed_stats(row, now) if row is not None else {'successes': 0, 'failures': 0, 'bytes': 0, 'seconds': 0}
+    if success:
+        stats['successes'] += 1
+        stats['bytes'] += downloaded_bytes
+        stats['seconds'] += seconds
+    else:
+        stats['failures'] += 1
+    conn.execute(
+        "INSERT OR REPLACE INTO client_stats (client, successes, failures, bytes, seconds, updated_at) "
+        "VALUES (?, ?, ?, ?, ?, ?)",
+        (client, stats['successes'], stats['failures'], stats['bytes'], stats['seconds'], now))
+    conn.commit()
+
+def rank_clients(conn, clients):
+    """Order clients by a Thompson sample of their success rate weighted by relative download throughput.
+
+    Sampling from Beta(successes + 1, failures + 1) keeps some exploration: a client with few
+    observations still gets tried now and then, while one that keeps failing sinks to the bottom.
+    """
+    stats = get_client_stats(conn)
+    throughputs = {client: s['bytes'] / s['seconds'] for client, s in stats.items() if s['seconds'] > 0}
+    best_throughput = max(throughputs.values(), default=0)
+
+    def score(client):
+        s = stats.get(client, {'successes': 0, 'failures': 0})
+        success_rate = random.betavariate(s['successes'] + 1, s['failures'] + 1)
+        # Clients without measured throughput are treated optimistically
+        speed = throughputs[client] / best_throughput if client in throughputs and best_throughput else 1
+        return success_rate * speed
+
+    scores = {client: score(client) for client in clients}
+    return sorted(clients, key=lambda client: scores[client], reverse=True)
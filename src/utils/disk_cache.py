@@ -0,0 +1,107 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+def cache_key(*parts):
+    """SHA-256 over the given str/bytes parts, length-prefixed so different splits never collide."""
+    digest = hashlib.sha256()
+    for part in parts:
+        data = part if isinstance(part, bytes) else str(part).encode('utf-8')
+        digest.update(len(data).to_bytes(8, 'little'))
+        digest.update(data)
+    return digest.hexdigest()
+
+class DiskCache:
+    """
+    JSON values in a SQLite file, shared by every process that opens the same path.
+
+    Entries above max_bytes in total are evicted least recently used first, and entries older
+    than max_age seconds (if given) are treated as missing. Hits and misses are counted for
+    this instance and accumulated in the file across runs.
+    """
+
+    def __init__(self, path, max_bytes, max_age=None):
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS entries_accessed_at ON entries (accessed_at);
+            CREATE TABLE IF NOT EXISTS counters (
+                name TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            );
+        """)
+        self.conn.commit()
+
+    def _count(self, name):
+        self.conn.execute("INSERT INTO counters (name, value) VALUES (?, 1) "
+                          "ON CONFLICT(name) DO UPDATE SET value = value + 1", (name,))
+
+    def get(self, key):
+        """The cached value, or None on a miss."""
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute("SELECT value, created_at FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is not None and self.max_age is not None and now - row[1] > self.max_age:
+                self.conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                row = None
+            if row is None:
+                self.misses += 1
+                self._count('misses')
+            else:
+                self.hits += 1
+                self._count('hits')
+                self.conn.execute("UPDATE entries SET accessed_at = ? WHERE key = ?", (now, key))
+            self.conn.commit()
+        return json.loads(row[0]) if row is not None else None
+
+    def put(self, key, value):
+        data = json.dumps(value, ensure_ascii=False)
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, data, len(data.encode('utf-8')), now, now))
+            self._evict()
+            self.conn.commit()
+
+    def _evict(self):
+        if self.max_age is not None:
+            self.conn.execute("DELETE FROM entries WHERE created_at < ?", (time.time() - self.max_age,))
+        excess = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0] - self.max_bytes
+        if excess <= 0:
+            return
+        evicted = []
+        for key, size in self.conn.execute("SELECT key, size FROM entries ORDER BY accessed_at"):
+            if excess <= 0:
+                break
+            evicted.append((key,))
+            excess -= size
+        self.conn.executemany("DELETE FROM entries WHERE key = ?", evicted)
+
+    def total_stats(self):
+        """Hits and misses accumulated by every run that used this cache file."""
+        with self.lock:
+            counters = dict(self.conn.execute("SELECT name, value FROM counters").fetchall())
+        return counters.get('hits', 0), counters.get('misses', 0)
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
@@ -0,0 +1,187 @@
+import json
+import os
+import sqlite3
+import time
+
+# Local record of every Url Inputs job. It is the source of truth for the pipeline state;
+# Airtable only receives the changes queued in the airtable_outbox table.
+
+STAGES = ['expand', 'download', 'transcribe', 'summarize']
+DONE_STAGE = 'done'
+# Playlist and channel jobs wait here until all of their video jobs are finished
+WAITING_STAGE = 'waiting'
+
+def open_job_store(path):
+    """Open (and create if needed) the SQLite job store."""
+    folder = os.path.dirname(path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    conn = sqlite3.connect(path)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS jobs (
+            record_id TEXT PRIMARY KEY,
+            url TEXT NOT NULL,
+            stage TEXT NOT NULL,
+            status TEXT NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            error TEXT,
+            created_at REAL NOT NULL,
+            updated_at REAL NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS stage_runs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            record_id TEXT NOT NULL,
+            stage TEXT NOT NULL,
+            status TEXT NOT NULL,
+            error TEXT,
+            started_at REAL NOT NULL,
+            finished_at REAL
+        );
+        CREATE TABLE IF NOT EXISTS airtable_outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            table_name TEXT NOT NULL,
+            record_id TEXT,
+            fields TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS airtable_dead_letters (
+            id INTEGER PRIMARY KEY,
+            table_name TEXT NOT NULL,
+            record_id TEXT,
+            fields TEXT NOT NULL,
+            error TEXT NOT NULL,
+            failed_at REAL NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS settings (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        );
+    """)
+    columns = [row['name'] for row in conn.execute("PRAGMA table_info(jobs)")]
+    if 'parent_record_id' not in columns:
+        conn.execute("ALTER TABLE jobs ADD COLUMN parent_record_id TEXT")
+    conn.commit()
+    return conn
+
+def get_job(conn, record_id):
+    return conn.execute("SELECT * FROM jobs WHERE record_id = ?", (record_id,)).fetchone()
+
+def add_job(conn, record_id, url, attempts=0, parent_record_id=None, stage=STAGES[0]):
+    now = time.time()
+    conn.execute(
+        "INSERT INTO jobs (record_id, url, stage, status, attempts, parent_record_id, created_at, updated_at) "
+        "VALUES (?, ?, ?, 'pending', ?, ?, ?, ?)",
+        (record_id, url, stage, attempts, parent_record_id, now, now))
+    conn.commit()
+
+def child_jobs(conn, parent_record_id):
+    return conn.execute("SELECT * FROM jobs WHERE parent_record_id = ? ORDER BY created_at",
+                        (parent_record_id,)).fetchall()
+
+def waiting_jobs(conn):
+    return conn.execute("SELECT * FROM jobs WHERE stage = ?", (WAITING_STAGE,)).fetchall()
+
+def set_job_stage(conn, record_id, stage):
+    conn.execute("UPDATE jobs SET stage = ?, status = 'pending', updated_at = ? WHERE record_id = ?",
+                 (stage, time.time(), record_id))
+    conn.commit()
+
+def requeue_job(conn, record_id, url, stage=STAGES[0]):
+    """Send a finished or failed job back to the first stage."""
+    conn.execute(
+        "UPDATE jobs SET url = ?, stage = ?, status = 'pending', attempts = 0, error = NULL, updated_at = ? "
+        "WHERE record_id = ?",
+        (url, stage, time.time(), record_id))
+    conn.commit()
+
+def resumable_jobs(conn):
+    """Jobs that were queued or running when the process stopped, oldest first."""
+    return conn.execute(
+        "SELECT * FROM jobs WHERE stage NOT IN (?, ?) AND status != 'failed' ORDER BY created_at",
+        (DONE_STAGE, WAITING_STAGE)).fetchall()
+
+def start_stage(conn, record_id, stage):
+    now = time.time()
+    conn.execute("UPDATE jobs SET stage = ?, status = 'running', updated_at = ? WHERE record_id = ?",
+                 (stage, now, record_id))
+    cursor = conn.execute("INSERT INTO stage_runs (record_id, stage, status, started_at) VALUES (?, ?, 'running', ?)",
+                          (record_id, stage, now))
+    conn.commit()
+    return cursor.lastrowid
+
+def finish_stage(conn, run_id, record_id, next_stage):
+    now = time.time()
+    conn.execute("UPDATE stage_runs SET status = 'done', finished_at = ? WHERE id = ?", (now, run_id))
+    conn.execute("UPDATE jobs SET stage = ?, status = 'pending', updated_at = ? WHERE record_id = ?",
+                 (next_stage, now, record_id))
+    conn.commit()
+
+def fail_stage(conn, run_id, record_id, error):
+    conn.execute("UPDATE stage_runs SET status = 'failed', error = ?, finished_at = ? WHERE id = ?",
+                 (error, time.time(), run_id))
+    fail_job(conn, record_id, error)
+
+def retry_stage(conn, run_id, record_id, error):
+    """Record a failed stage run of a job that will run the same stage again."""
+    now = time.time()
+    conn.execute("UPDATE stage_runs SET status = 'failed', error = ?, finished_at = ? WHERE id = ?", (error, now, run_id))
+    conn.execute("UPDATE jobs SET status = 'pending', error = ?, updated_at = ? WHERE record_id = ?", (error, now, record_id))
+    conn.commit()
+
+def fail_job(conn, record_id, error):
+    conn.execute("UPDATE jobs SET status = 'failed', error = ?, updated_at = ? WHERE record_id = ?",
+                 (error, time.time(), record_id))
+    conn.commit()
+
+def set_attempts(conn, record_id, attempts):
+    conn.execute("UPDATE jobs SET attempts = ?, updated_at = ? WHERE record_id = ?",
+                 (attempts, time.time(), record_id))
+    conn.commit()
+
+def stage_timings(conn, record_id):
+    """Return (stage, status, seconds) for every stage run of a job."""
+    rows = conn.execute(
+        "SELECT stage, status, started_at, finished_at FROM stage_runs WHERE record_id = ? ORDER BY id",
+        (record_id,)).fetchall()
+    return [(row['stage'], row['status'], (row['finished_at'] or time.time()) - row['started_at']) for row in rows]
+
+def get_setting(conn, key, default=None):
+    row = conn.execute("SELECT value FROM settings WHERE key = ?", (key,)).fetchone()
+    return row['value'] if row is not None else default
+
+def set_setting(conn, key, value):
+    conn.execute("INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)", (key, str(value)))
+    conn.commit()
+
+# AIRTABLE OUTBOX
+
+def queue_airtable_update(conn, table_name, record_id, fields):
+    conn.execute("INSERT INTO airtable_outbox (table_name, record_id, fields) VALUES (?, ?, ?)",
+                 (table_name, record_id, json.dumps(fields, ensure_ascii=False)))
+    conn.commit()
+
+def queue_airtable_insert(conn, table_name, fields):
+    queue_airtable_update(conn, table_name, None, fields)
+
+def pending_airtable_changes(conn, limit=100):
+    """Return (id, table_name, record_id, fields) in the order they were queued; record_id is None for inserts."""
+    rows = conn.execute("SELECT * FROM airtable_outbox ORDER BY id LIMIT ?", (limit,)).fetchall()
+    return [(row['id'], row['table_name'], row['record_id'], json.loads(row['fields'])) for row in rows]
+
+def has_pending_airtable_changes(conn, record_id):
+    row = conn.execute("SELECT 1 FROM airtable_outbox WHERE record_id = ? LIMIT 1", (record_id,)).fetchone()
+    return row is not None
+
+def dead_letter_airtable_changes(conn, change_ids, error):
+    """Move changes Airtable rejected for good out of the outbox, keeping them for inspection."""
+    now = time.time()
+    for change_id in change_ids:
+        conn.execute("INSERT OR REPLACE INTO airtable_dead_letters (id, table_name, record_id, fields, error, failed_at) "
+                     "SELECT id, table_name, record_id, fields, ?, ? FROM airtable_outbox WHERE id = ?", (error, now, change_id))
+        conn.execute("DELETE FROM airtable_outbox WHERE id = ?", (change_id,))
+    conn.commit()
+
+def remove_airtable_changes(conn, change_ids):
+    conn.executemany("DELETE FROM airtable_outbox WHERE id = ?", [(change_id,) for change_id in change_ids])
+    conn.commit()
@@ -0,0 +1,43 @@
+import json
+import os
+
+# Transcription progress of one video: a JSON line per finished chunk with its segments.
+# Each entry carries a key describing how the chunk was produced (local model and sample spans,
+# or API model, bitrate and sample spans), so entries from a different chunk plan are never reused.
+
+SEGMENTS_FILE_NAME = "segments.jsonl"
+
+def load_checkpoint(path, chunk_keys):
+    """Return {chunk_index: segments} for the chunks of the current plan that an earlier run finished."""
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'rb+') as f:
+        content = f.read()
+        # A crash can leave half a line at the end; cut it off so new entries start on a fresh line
+        if content and not content.endswith(b'\n'):
+            f.truncate(content.rfind(b'\n') + 1)
+
+    done = {}
+    for line in content.decode('utf-8', errors='ignore').splitlines():
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            continue
+        idx = entry.get('chunk')
+        if isinstance(idx, int) and 0 <= idx < len(chunk_keys) and entry.get('key') == chunk_keys[idx]:
+            done[idx] = entry['segments']
+    return done
+
+def append_checkpoint(path, idx, key, segments):
+    """Record a finished chunk, synced to disk before returning."""
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(json.dumps({'chunk': idx, 'key': key, 'segments': segments}, ensure_ascii=False) + '\n')
+        f.flush()
+        os.fsync(f.fileno())
+
+def assemble_transcription(chunk_segments, separator=''):
+    """Join the segment texts of all chunks in order."""
+    chunk_texts = [''.join(segment['text'] for segment in segments) for segments in chunk_segments]
+    if separator:
+        chunk_texts = [text.strip() for text in chunk_texts]
+    return separator.join(chunk_texts)
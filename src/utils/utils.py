@@ -3,6 +3,8 @@ import json
 import os
 import random
 import re
+import shutil
+from urllib.parse import parse_qs, urlparse
 
 # GUI
 
@@ -88,9 +90,86 @@ def save_transcription_to_file(transcription, file_hash, youtube_url, title, aut
         f.write(f"{author}\n")
         f.write(transcription)
 
+def save_video_info(file_hash, title, author):
+    file_path = get_data_folder(file_hash, "info.json")
+    with open(file_path, 'w', encoding='utf-8') as f:
+        json.dump({"title": title, "author": author}, f, ensure_ascii=False)
+
+def read_video_info(file_hash):
+    file_path = get_data_folder(file_hash, "info.json")
+    if not os.path.exists(file_path):
+        return None, None
+    with open(file_path, 'r', encoding='utf-8') as f:
+        info = json.load(f)
+    return info["title"], info["author"]
+
 def hash_url(url):
     return hashlib.sha1(url.encode()).hexdigest()
 
+def get_video_id(url):
+    """Extract the YouTube video id from any of the watch, short link, shorts, embed or live URL forms."""
+    parsed = urlparse(url.strip())
+    host = parsed.netloc.lower().split(':')[0]
+    path_parts = [part for part in parsed.path.split('/') if part]
+
+    video_id = None
+    if host == 'youtu.be':
+        video_id = path_parts[0] if path_parts else None
+    elif host.endswith('youtube.com') or host.endswith('youtube-nocookie.com'):
+        query = parse_qs(parsed.query)
+        if 'v' in query:
+            video_id = query['v'][0]
+        elif len(path_parts) >= 2 and path_parts[0] in ('shorts', 'embed', 'live', 'v', 'e'):
+            video_id = path_parts[1]
+
+    if video_id and re.fullmatch(r'[A-Za-z0-9_-]{11}', video_id):
+        return video_id
+    return None
+
+def is_collection_url(url):
+    """True for YouTube playlist and channel URLs, which stand for many videos."""
+    parsed = urlparse(url.strip())
+    host = parsed.netloc.lower().split(':')[0]
+    if not host.endswith('youtube.com'):
+        return False
+    path = parsed.path.rstrip('/')
+    if path == '/playlist':
+        return 'list' in parse_qs(parsed.query)
+    return path.startswith(('/@', '/channel/', '/c/', '/user/'))
+
+def get_cache_key(url):
+    """Name of the data folder for a URL: the video id, so every URL form of a video shares one cache entry."""
+    return get_video_id(url) or hash_url(url)
+
+def _folder_has_files(folder_path):
+    return os.path.isdir(folder_path) and any(os.scandir(folder_path))
+
+def resolve_cache_folder(url):
+    """Return the cache key for a URL, moving a folder cached under the old sha1(url) name to it first."""
+    folder = get_cache_key(url)
+    legacy_path = f"data/{hash_url(url)}"
+    folder_path = f"data/{folder}"
+    if legacy_path != folder_path and _folder_has_files(legacy_path) and not _folder_has_files(folder_path):
+        if os.path.isdir(folder_path):
+            os.rmdir(folder_path)
+        shutil.move(legacy_path, folder_path)
+    return folder
+
+def migrate_legacy_folders():
+    """Move data/<sha1(url)>/ folders with a transcription to their video id folder, returning how many moved."""
+    if not os.path.isdir("data"):
+        return 0
+    migrated = 0
+    for entry in os.scandir("data"):
+        transcription_path = os.path.join(entry.path, "transcription.txt")
+        if not re.fullmatch(r'[0-9a-f]{40}', entry.name) or not os.path.exists(transcription_path):
+            continue
+        with open(transcription_path, 'r', encoding='utf-8') as f:
+            url = f.readline().strip()
+        if hash_url(url) == entry.name and resolve_cache_folder(url) != entry.name and not os.path.exists(entry.path):
+            migrated += 1
+    return migrated
+
 def read_transcription_file(file_path):
     with open(file_path, 'r', encoding='utf-8') as file:
         lines = file.readlines()